@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -77,7 +78,29 @@ WSGI_APPLICATION = 'SearchSmartly.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # SEARCHSMARTLY_DB lets the benchmark runner point each run at a fresh database
+        'NAME': os.environ.get('SEARCHSMARTLY_DB', BASE_DIR / 'db.sqlite3'),
+        # The importers' writers open the database file with sqlite3 themselves,
+        # so tests need a file rather than the in-memory default
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Query results are keyed by the dataset generation (geoDataImportApp/querycache.py),
+# so imports invalidate them and the timeout only limits how long unused entries
+# stay; past MAX_ENTRIES the least recently used are evicted.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'searchsmartly',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
@@ -1,8 +1,55 @@
 from django.contrib import admin
-from .models import PointsOfInterest
+from .changelist import CachedCountPaginator, KeysetChangeList
+from .models import CategoryStats, ImportManifest, PointsOfInterest, QuarantinedRow
+
+class CategoryListFilter(admin.SimpleListFilter):
+    # The category choices come from one index seek per category (a loose scan
+    # of poi_category_idx) instead of a SELECT DISTINCT over every row
+    title = 'poi category'
+    parameter_name = 'poi_category'
+
+    def lookups(self, request, model_admin):
+        return [(category, category) for category in PointsOfInterest.objects.categories()]
+
+    def queryset(self, request, queryset):
+        if self.value() is not None:
+            return queryset.filter(poi_category=self.value())
+        return queryset
 
 @admin.register(PointsOfInterest)
 class CsvPointOfInterestAdmin(admin.ModelAdmin):
-    list_display = ['poi_id', 'poi_name', 'poi_category', 'average_rating', 'poi_latitude', 'poi_longitude', 'data_origin', 'poi_description']
-    search_fields = ['poi_id', 'poi_name']
-    list_filter = ['poi_category']
\ No newline at end of file
+    list_display = ['poi_id', 'poi_name', 'poi_category', 'average_rating', 'rating_count', 'rating_min', 'rating_max', 'poi_latitude', 'poi_longitude', 'data_origin', 'poi_description']
+    search_fields = ['poi_id', 'poi_name', 'poi_description']
+    list_filter = [CategoryListFilter]
+    paginator = CachedCountPaginator
+    # Rendering the cells is most of a page view once the queries are indexed
+    list_per_page = 50
+    # Skips the second COUNT(*) of the whole table behind "x of y selected"
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # An id finds that PoI, anything else goes to the full-text index instead
+        # of a LIKE '%term%' scan per search field
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit() and queryset.filter(poi_id=int(search_term)).exists():
+            return queryset.filter(poi_id=int(search_term)), False
+        return queryset.search(search_term), False
+
+@admin.register(CategoryStats)
+class CategoryStatsAdmin(admin.ModelAdmin):
+    list_display = ['poi_category', 'poi_count', 'rated_count', 'average_rating', 'rated_1', 'rated_2', 'rated_3', 'rated_4', 'rated_5', 'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude']
+
+@admin.register(ImportManifest)
+class ImportManifestAdmin(admin.ModelAdmin):
+    list_display = ['file_path', 'file_size', 'committed_rows', 'committed_offset', 'completed', 'updated_at']
+
+@admin.register(QuarantinedRow)
+class QuarantinedRowAdmin(admin.ModelAdmin):
+    list_display = ['source_file', 'row_index', 'reason', 'row_data', 'rejected_at']
+    search_fields = ['source_file']
+    list_filter = ['reason']
@@ -0,0 +1,100 @@
+import json
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from geoDataImportApp.querycache import cached_query
+
+KEYSET_VAR = 'after'
+
+
+class CachedCountPaginator(Paginator):
+    # Changelist counts are cached per query until the next import, so paging
+    # through a large table doesn't run a COUNT(*) on every page view
+    @cached_property
+    def count(self):
+        try:
+            sql = self.object_list.query.sql_with_params()
+        except EmptyResultSet:
+            # none(), e.g. a search without any words, has no SQL to key on
+            return 0
+        return cached_query('count', sql, lambda: super(CachedCountPaginator, self).count)
+
+
+class KeysetChangeList(ChangeList):
+    # Adds a "next page" link that carries on after the sort key of the last row
+    # shown (?after=[...]), a WHERE the index answers directly, where page p of
+    # the numbered pages is an OFFSET that steps over every row before it.
+    # Counts and page numbers stay those of the whole filtered list.
+
+    def __init__(self, request, *args, **kwargs):
+        self.keyset_after = request.GET.get(KEYSET_VAR)
+        self.keyset_next_url = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(KEYSET_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Sorting, filtering and numbered pages start again from the top
+        new_params = new_params or {}
+        if KEYSET_VAR not in new_params:
+            remove = list(remove or []) + [KEYSET_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def _get_deterministic_ordering(self, ordering):
+        # Ties are broken on the primary key in the direction of the last sort
+        # column, so (column, pk) reads straight off the column's index either way
+        ordering = super()._get_deterministic_ordering(ordering)
+        if len(ordering) > 1 and ordering[-1] == '-pk' and isinstance(ordering[-2], str) and not ordering[-2].startswith('-'):
+            ordering[-1] = 'pk'
+        return ordering
+
+    def keyset_fields(self, queryset):
+        # The fields the queryset is sorted on and whether it is descending, or
+        # None when the sort can't be continued from a key (expressions, mixed
+        # directions)
+        fields, directions = [], set()
+        for name in queryset.query.order_by:
+            if not isinstance(name, str):
+                return None
+            directions.add(name.startswith('-'))
+            name = name.lstrip('-')
+            try:
+                fields.append(self.lookup_opts.pk if name == 'pk' else self.lookup_opts.get_field(name))
+            except FieldDoesNotExist:
+                return None
+        if len(directions) != 1:
+            return None
+        return fields, directions.pop()
+
+    def get_results(self, request):
+        super().get_results(request)
+        if not self.multi_page or (self.show_all and self.can_show_all):
+            return
+        keyset = self.keyset_fields(self.queryset)
+        if keyset is None:
+            return
+        fields, descending = keyset
+
+        if self.keyset_after is not None:
+            try:
+                values = json.loads(self.keyset_after)
+            except ValueError:
+                values = None
+            if not isinstance(values, list) or len(values) != len(fields):
+                return
+            columns = ', '.join(f'"{self.lookup_opts.db_table}"."{field.column}"' for field in fields)
+            self.result_list = self.queryset.extra(
+                where=[f"({columns}) {'<' if descending else '>'} ({', '.join(['%s'] * len(fields))})"],
+                params=values,
+            )[:self.list_per_page]
+
+        rows = list(self.result_list)
+        if len(rows) == self.list_per_page:
+            values = [getattr(rows[-1], field.attname) for field in fields]
+            # SQL row values compare NULL as unknown, so there is no key after one
+            if None not in values:
+                self.keyset_next_url = self.get_query_string({KEYSET_VAR: json.dumps(values)})
@@ -0,0 +1,125 @@
+import io
+import csv
+import bz2
+import gzip
+import lzma
+import math
+import zlib
+from json.encoder import encode_basestring_ascii as quote
+from xml.sax.saxutils import escape
+from geoDataImportApp.ratings import unpack_ratings
+from geoDataImportApp.upsert import POI_TABLE
+
+# Exports are written in the schemas the importers read (and
+# generate_poi_data writes), so a file goes straight back into any of them.
+# Rows come off the cursor in chunks and every chunk is encoded as one piece
+# of text, so memory stays flat however large the table is.
+EXPORT_CHUNK_ROWS = 10000
+# gzip's default level 9 costs several times level 6 for a few percent
+EXPORT_GZIP_LEVEL = 6
+COMPRESSED_EXPORT_WRITERS = {
+    'gzip': lambda path: gzip.GzipFile(path, 'wb', compresslevel=EXPORT_GZIP_LEVEL),
+    'bz2': lambda path: bz2.BZ2File(path, 'wb'),
+    'xz': lambda path: lzma.LZMAFile(path, 'wb'),
+}
+EXPORT_COLUMNS = 'poi_id, poi_name, poi_category, poi_latitude, poi_longitude, poi_ratings, rating_values, poi_description'
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'jsonl': 'application/x-ndjson',
+    'xml': 'application/xml',
+}
+
+
+def iter_export_rows(cursor, chunk_rows=EXPORT_CHUNK_ROWS):
+    cursor.execute(f"SELECT {EXPORT_COLUMNS} FROM {POI_TABLE} ORDER BY poi_id")
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        yield rows
+
+
+def ratings_text(poi_ratings):
+    # CSV and XML imports keep the braces around ratings, JSON imports don't
+    return '{' + (poi_ratings or '').strip('{}') + '}'
+
+
+def encode_csv(chunks):
+    # CSV carries no description
+    yield 'poi_id,poi_name,poi_category,poi_latitude,poi_longitude,poi_ratings\r\n'
+    for rows in chunks:
+        text = io.StringIO()
+        csv.writer(text).writerows(
+            (poi_id, name, category, latitude, longitude, ratings_text(ratings))
+            for poi_id, name, category, latitude, longitude, ratings, _, _ in rows
+        )
+        yield text.getvalue()
+
+
+def json_number(value):
+    # repr() like dumps(allow_nan=False) writes floats, which refuses NaN and
+    # infinity too rather than write a file no JSON reader accepts
+    if not math.isfinite(value):
+        raise ValueError(f"Out of range float values are not JSON compliant: {value!r}")
+    return repr(value)
+
+
+def json_objects(rows):
+    # One JSON object per row, in the importers' JSON schema. Strings go through
+    # the json module's C escaper, floats through json_number().
+    return [
+        f'{{"id": {poi_id}, "name": {quote(name)}, '
+        f'"coordinates": {{"latitude": {json_number(latitude)}, "longitude": {json_number(longitude)}}}, '
+        f'"category": {quote(category)}, "ratings": [{", ".join(map(json_number, unpack_ratings(rating_values)))}], '
+        f'"description": {quote(description or "")}}}'
+        for poi_id, name, category, latitude, longitude, _, rating_values, description in rows
+    ]
+
+
+def encode_json(chunks):
+    yield '['
+    separator = '\n'
+    for rows in chunks:
+        yield separator + ',\n'.join(json_objects(rows))
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def encode_ndjson(chunks):
+    for rows in chunks:
+        yield '\n'.join(json_objects(rows)) + '\n'
+
+
+def encode_xml(chunks):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<RECORDS>\n'
+    for rows in chunks:
+        yield ''.join(
+            f"<DATA_RECORD><pid>{poi_id}</pid><pname>{escape(name)}</pname>"
+            f"<pcategory>{escape(category)}</pcategory>"
+            f"<platitude>{latitude!r}</platitude><plongitude>{longitude!r}</plongitude>"
+            f"<pratings>{escape(ratings_text(ratings))}</pratings>"
+            f"<poi_description>{escape(description or '')}</poi_description></DATA_RECORD>\n"
+            for poi_id, name, category, latitude, longitude, ratings, _, description in rows
+        )
+    yield '</RECORDS>\n'
+
+
+EXPORT_ENCODERS = {
+    'csv': encode_csv,
+    'json': encode_json,
+    'ndjson': encode_ndjson,
+    'jsonl': encode_ndjson,
+    'xml': encode_xml,
+}
+
+
+def gzip_chunks(chunks, level=EXPORT_GZIP_LEVEL):
+    # Compresses an encoder's output as it is produced, as a .gz stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
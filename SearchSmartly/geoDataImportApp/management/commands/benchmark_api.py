@@ -0,0 +1,130 @@
+import time
+import random
+import asyncio
+import statistics
+from urllib.parse import urlencode, urlsplit
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from geoDataImportApp.models import PointsOfInterest
+
+ENDPOINTS = ('nearby', 'search', 'pois')
+
+class Command(BaseCommand):
+    help = 'Load-test the sync geo endpoints against their async versions (/geo/async/...) at several concurrency levels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', type=str, default=','.join(ENDPOINTS), help=f"Comma-separated, any of {', '.join(ENDPOINTS)}")
+        parser.add_argument('--concurrency', type=str, default='1,16,64', help='Comma-separated numbers of requests in flight at once')
+        parser.add_argument('--requests', type=int, default=400, help='Requests per endpoint and concurrency level')
+        parser.add_argument('--url', type=str, default=None, help='Base URL of a running server (e.g. http://127.0.0.1:8000); without it the ASGI application is called in-process')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        endpoints = [endpoint for endpoint in options['endpoints'].split(',') if endpoint]
+        unknown = [endpoint for endpoint in endpoints if endpoint not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(unknown)}")
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',') if level]
+        except ValueError:
+            raise CommandError(f"Invalid concurrency: '{options['concurrency']}'")
+
+        total = PointsOfInterest.objects.count()
+        if not total:
+            raise CommandError("No PoIs to query, import some first")
+        rng = random.Random(options['seed'])
+        names = list(PointsOfInterest.objects.order_by('?').values_list('poi_name', flat=True)[:1000])
+        highest_id = PointsOfInterest.objects.order_by('-poi_id').values_list('poi_id', flat=True).first()
+
+        def query(endpoint):
+            if endpoint == 'nearby':
+                return {'lat': round(rng.uniform(-80, 80), 4), 'lon': round(rng.uniform(-180, 180), 4), 'k': 10}
+            if endpoint == 'search':
+                # Words of random names, so few searches repeat within a run
+                return {'q': ' '.join(rng.choice(names).split()[:2]), 'limit': 20}
+            return {'after': rng.randint(0, highest_id), 'limit': 100}
+
+        request = http_request(options['url']) if options['url'] else asgi_request(get_asgi_application())
+        self.stdout.write(f"PoIs: {total}, {options['requests']} requests per run, {'server ' + options['url'] if options['url'] else 'in-process ASGI'}")
+        for endpoint in endpoints:
+            for level in levels:
+                queries = [urlencode(query(endpoint)) for _ in range(options['requests'])]
+                results = {}
+                for prefix in ('/geo/', '/geo/async/'):
+                    # Both runs send the same queries, neither may find the other's cached results
+                    cache.clear()
+                    paths = [f"{prefix}{endpoint}?{query_string}" for query_string in queries]
+                    results[prefix] = asyncio.run(run_load(request, paths, level))
+                sync_rate, async_rate = results['/geo/'][0], results['/geo/async/'][0]
+                for prefix, (rate, p50, p95, errors) in results.items():
+                    self.stdout.write(
+                        f"{prefix + endpoint:<18} concurrency {level:>4}: {rate:8.1f} req/s, "
+                        f"p50 {p50 * 1000:7.1f} ms, p95 {p95 * 1000:7.1f} ms" + (f", {errors} errors" if errors else '')
+                    )
+                self.stdout.write(self.style.SUCCESS(f"{endpoint} at concurrency {level}: async {async_rate / sync_rate:.2f}x the throughput of sync"))
+
+async def run_load(request, paths, concurrency):
+    # Sends every path with at most concurrency requests in flight, returns
+    # (requests per second, p50 latency, p95 latency, non-200 responses)
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def send(path):
+        nonlocal errors
+        async with slots:
+            start_time = time.perf_counter()
+            status = await request(path)
+            latencies.append(time.perf_counter() - start_time)
+            errors += status != 200
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(send(path) for path in paths))
+    elapsed = time.perf_counter() - start_time
+    latencies.sort()
+    return len(paths) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1], errors
+
+def asgi_request(application):
+    # Calls the ASGI application directly, the way a server would, and reads
+    # the whole response
+    async def request(path):
+        path, _, query_string = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(), 'root_path': '',
+            'headers': [(b'host', b'localhost')], 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+        }
+        sent = asyncio.Event()
+        status = None
+
+        async def receive():
+            if not sent.is_set():
+                sent.set()
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # The client never disconnects; Django stops listening once it has responded
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await application(scope, receive, send)
+        return status
+    return request
+
+def http_request(base_url):
+    # One HTTP/1.1 connection per request to a running server
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+
+    async def request(path):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"GET {url.path.rstrip('/')}{path} HTTP/1.1\r\nHost: {url.netloc}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        await writer.wait_closed()
+        return int(response.split(b' ', 2)[1]) if response else None
+    return request
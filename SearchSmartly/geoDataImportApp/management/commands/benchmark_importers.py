@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import tempfile
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from geoDataImportApp.management.commands.generate_poi_data import write_dataset
+from geoDataImportApp.readers import get_file_format
+
+IMPORTERS = ['import_poi_data', 'import_poi_data_fast', 'import_poi_data_lightning']
+MANAGE_PY = os.path.join(settings.BASE_DIR, 'manage.py')
+
+class Command(BaseCommand):
+    help = 'Run the importers against synthetic datasets on a fresh database and record time, peak RSS and rows inserted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Dataset sizes in rows')
+        parser.add_argument('--formats', nargs='+', default=['csv', 'json', 'xml'], help='Dataset extensions, e.g. csv json ndjson xml csv.gz json.bz2 xml.xz')
+        parser.add_argument('--importers', nargs='+', default=IMPORTERS, choices=IMPORTERS)
+        parser.add_argument('--repeat', type=int, default=1, help='Runs per importer and dataset, the fastest one is kept')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--data-dir', type=str, default='benchmark_data', help='Where generated datasets are kept and reused')
+        parser.add_argument('--output', type=str, default=None, help='Write the results as JSON to this path')
+        parser.add_argument('--baseline', type=str, default=None, help='Results JSON of an earlier run to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown against the baseline before a run counts as a regression')
+
+    def handle(self, *args, **options):
+        for file_format in options['formats']:
+            if get_file_format(f"pois.{file_format}") is None:
+                raise CommandError(f"Unsupported dataset format: '{file_format}'")
+        os.makedirs(options['data_dir'], exist_ok=True)
+        datasets = []
+        for rows in options['sizes']:
+            for file_format in options['formats']:
+                path = os.path.join(options['data_dir'], f"pois-{rows}-seed{options['seed']}.{file_format}")
+                if not os.path.exists(path):
+                    self.stdout.write(f"Generating {path}...")
+                    write_dataset(path, rows, options['seed'])
+                datasets.append(path)
+
+        if not hasattr(os, 'wait4'):
+            self.stdout.write(self.style.WARNING("Peak RSS unavailable on this platform (no os.wait4), recording time and rows only"))
+        results = []
+        with tempfile.TemporaryDirectory() as work_dir:
+            template_db = os.path.join(work_dir, 'template.sqlite3')
+            run_command(['migrate', '-v', '0'], template_db, work_dir)
+
+            for dataset in datasets:
+                for importer in options['importers']:
+                    runs = [run_importer(importer, dataset, template_db, work_dir) for _ in range(options['repeat'])]
+                    result = min(runs, key=lambda run: run['time'])
+                    results.append(result)
+                    self.stdout.write(
+                        f"{importer:<26} {os.path.basename(dataset):<28} {result['time']:>9.3f}s "
+                        + (f"{result['peak_rss_mb']:>8.1f} MB " if result['peak_rss_mb'] is not None else f"{'n/a':>11} ")
+                        + f"{result['rows_inserted']:>10,} rows"
+                        + ("" if result['exit_code'] == 0 else f"  (exit code {result['exit_code']})")
+                    )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'python': sys.version, 'results': results}, file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)['results']
+            regressions = find_regressions(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+def run_importer(importer, dataset, template_db, work_dir):
+    # Every run starts from a freshly migrated, empty database
+    database = os.path.join(work_dir, 'run.sqlite3')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+    shutil.copyfile(template_db, database)
+
+    elapsed, peak_rss_mb, exit_code = run_command([importer, os.path.abspath(dataset)], database, work_dir)
+    with sqlite3.connect(database) as conn:
+        rows_inserted = conn.execute("SELECT COUNT(*) FROM geoDataImportApp_pointsofinterest").fetchone()[0]
+    return {
+        'importer': importer,
+        'dataset': os.path.basename(dataset),
+        'time': elapsed,
+        'peak_rss_mb': peak_rss_mb,
+        'rows_inserted': rows_inserted,
+        'exit_code': exit_code,
+    }
+
+def run_command(arguments, database, work_dir):
+    # wait4 gives the resource usage of this one child, so peak RSS isn't
+    # mixed up with earlier runs the way RUSAGE_CHILDREN would be. Where there
+    # is no wait4 (Windows) the peak RSS is None.
+    environment = dict(os.environ, SEARCHSMARTLY_DB=database)
+    peak_rss_mb = None
+    with open(os.path.join(work_dir, 'output.log'), 'w') as log:
+        start_time = time.perf_counter()
+        process = subprocess.Popen([sys.executable, MANAGE_PY] + arguments, env=environment, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+            peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+        else:
+            process.wait()
+        elapsed = time.perf_counter() - start_time
+    if arguments[0] == 'migrate' and process.returncode:
+        with open(log.name) as log:
+            raise CommandError(f"Could not migrate the benchmark database:\n{log.read()}")
+    return elapsed, peak_rss_mb, process.returncode
+
+def find_regressions(results, baseline, tolerance):
+    previous = {(result['importer'], result['dataset']): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['importer'], result['dataset']))
+        if before is None:
+            continue
+        if result['rows_inserted'] != before['rows_inserted']:
+            regressions.append(f"{result['importer']} {result['dataset']}: {result['rows_inserted']} rows inserted, baseline {before['rows_inserted']}")
+        if result['time'] > before['time'] * (1 + tolerance):
+            regressions.append(f"{result['importer']} {result['dataset']}: {result['time']:.3f}s, baseline {before['time']:.3f}s")
+    return regressions
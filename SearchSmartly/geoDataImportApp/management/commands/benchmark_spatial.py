@@ -0,0 +1,59 @@
+import time
+import random
+from django.core.management.base import BaseCommand, CommandError
+from geoDataImportApp.models import PointsOfInterest
+
+class Command(BaseCommand):
+    help = 'Compare within_bbox (R*Tree) against a plain coordinate range scan on the imported PoIs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Number of random viewports')
+        parser.add_argument('--size', type=float, default=1.0, help='Viewport height and width in degrees')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per implementation, the best one is reported')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        total = PointsOfInterest.objects.count()
+        if not total:
+            raise CommandError("No PoIs to query, import some first")
+
+        rng = random.Random(options['seed'])
+        size = options['size']
+        viewports = []
+        for _ in range(options['queries']):
+            south = rng.uniform(-90, 90 - size)
+            west = rng.uniform(-180, 180 - size)
+            viewports.append((south, west, south + size, west + size))
+
+        def rtree():
+            return [list(PointsOfInterest.objects.within_bbox(*viewport).values_list('poi_id', flat=True)) for viewport in viewports]
+
+        def scan():
+            return [
+                list(PointsOfInterest.objects.filter(
+                    poi_latitude__gte=south, poi_latitude__lte=north,
+                    poi_longitude__gte=west, poi_longitude__lte=east,
+                ).values_list('poi_id', flat=True))
+                for south, west, north, east in viewports
+            ]
+
+        expected = [sorted(ids) for ids in scan()]
+        if [sorted(ids) for ids in rtree()] != expected:
+            raise CommandError("within_bbox returns different PoIs than the range scan")
+
+        scan_time = best_time(scan, options['repeat'])
+        rtree_time = best_time(rtree, options['repeat'])
+        matches = sum(map(len, expected))
+
+        self.stdout.write(f"PoIs: {total}, {len(viewports)} viewports of {size}x{size} degrees, {matches / len(viewports):.1f} PoIs per viewport")
+        self.stdout.write(f"Range scan: {scan_time:.3f}s ({scan_time / len(viewports) * 1000:.2f} ms per query)")
+        self.stdout.write(f"R*Tree:     {rtree_time:.3f}s ({rtree_time / len(viewports) * 1000:.2f} ms per query)")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {scan_time / rtree_time:.1f}x, results identical"))
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
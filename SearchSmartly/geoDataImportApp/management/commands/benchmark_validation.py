@@ -0,0 +1,82 @@
+import time
+import random
+from django.core.management.base import BaseCommand, CommandError
+from geoDataImportApp.readers import POI_ID, POI_LATITUDE, POI_RATINGS
+from geoDataImportApp.validation import validate_batch
+from geoDataImportApp.management.commands.import_poi_data_lightning import validate_and_create_point
+
+class Command(BaseCommand):
+    help = 'Compare row-at-a-time and NumPy batch validation on synthetic rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of synthetic rows to validate')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per validate_batch call')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per implementation, the best one is reported')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rows = generate_rows(options['rows'], options['seed'])
+        batch_size = options['batch_size']
+        batches = [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+
+        def row_at_a_time():
+            validated = []
+            for batch in batches:
+                for row in batch:
+                    validated_row = validate_and_create_point(row, 'csv')
+                    if validated_row:
+                        validated.append(validated_row)
+            return validated
+
+        def vectorised():
+            validated = []
+            for batch in batches:
+                validated.extend(validate_batch(batch, 'csv'))
+            return validated
+
+        expected = row_at_a_time()
+        if vectorised() != expected:
+            raise CommandError("validate_batch output differs from validate_and_create_point")
+
+        row_time = best_time(row_at_a_time, options['repeat'])
+        batch_time = best_time(vectorised, options['repeat'])
+
+        self.stdout.write(f"Rows: {len(rows)} ({len(expected)} valid), batch size {batch_size}")
+        self.stdout.write(f"Row-at-a-time: {row_time:.3f}s ({len(rows) / row_time:,.0f} rows/s)")
+        self.stdout.write(f"Vectorised:    {batch_time:.3f}s ({len(rows) / batch_time:,.0f} rows/s)")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {row_time / batch_time:.2f}x, outputs identical"))
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+def generate_rows(count, seed):
+    # Mostly clean rows with the kinds of damage seen in real feeds mixed in
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        ratings = [f"{rng.uniform(1, 5):.1f}" for _ in range(rng.choice([0, 1, 2, 3, 4, 5, 6, 12]))]
+        # Records as the CSV reader hands them out, see readers.RECORD_FIELDS
+        row = [
+            str(index + 1),
+            f"Place {index}",
+            f"category-{rng.randint(1, 40)}",
+            repr(rng.uniform(-90, 90)),
+            repr(rng.uniform(-180, 180)),
+            '{' + ','.join(ratings) + '}',
+        ]
+        damage = rng.random()
+        if damage < 0.002:
+            row[POI_ID] = rng.choice(['', 'abc', '1.5', None])
+        elif damage < 0.004:
+            row[POI_LATITUDE] = rng.choice(['', 'north', None])
+        elif damage < 0.006:
+            row[POI_RATINGS] = rng.choice(['{4.0,bad}', '{ ,3.5}', '{,}', '{}'])
+        elif damage < 0.007:
+            row = row[:rng.randint(0, POI_RATINGS)]
+        rows.append(row)
+    return rows
@@ -0,0 +1,41 @@
+import io
+import os
+import time
+from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+from geoDataImportApp.export import COMPRESSED_EXPORT_WRITERS, EXPORT_CHUNK_ROWS, EXPORT_ENCODERS, iter_export_rows
+from geoDataImportApp.management.commands.generate_poi_data import dataset_format
+from geoDataImportApp.readers import split_compression
+
+class Command(BaseCommand):
+    help = 'Export the imported PoIs to a CSV, JSON, NDJSON or XML file the importers can read back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str, help='File to write, the format is taken from its extension (.gz, .bz2 and .xz compress it)')
+        parser.add_argument('--chunk-rows', type=int, default=EXPORT_CHUNK_ROWS, help='Rows fetched from the database and encoded at a time')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        file_format = dataset_format(output)
+        if file_format not in EXPORT_ENCODERS:
+            raise CommandError(f"Unsupported file type: '{output.split('.')[-1]}'")
+
+        start_time = time.perf_counter()
+        compression = split_compression(output)[1]
+        if compression:
+            file = io.TextIOWrapper(COMPRESSED_EXPORT_WRITERS[compression](output), encoding='utf-8', newline='')
+        else:
+            file = open(output, 'w', newline='', encoding='utf-8')
+        rows = 0
+        with file, connection.cursor() as cursor:
+            def chunks():
+                nonlocal rows
+                for chunk in iter_export_rows(cursor, options['chunk_rows']):
+                    rows += len(chunk)
+                    yield chunk
+            for text in EXPORT_ENCODERS[file_format](chunks()):
+                file.write(text)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {rows} PoIs to {output} ({os.path.getsize(output):,} bytes) in {time.perf_counter() - start_time:.2f}s"
+        ))
@@ -0,0 +1,129 @@
+import io
+import os
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import random
+from xml.sax.saxutils import escape
+from django.core.management.base import BaseCommand, CommandError
+from geoDataImportApp.readers import split_compression
+
+CATEGORIES = 50
+INVALID_VALUES = {
+    'id': ['', 'abc', '1.5'],
+    'latitude': ['', 'north'],
+    'longitude': ['', 'east'],
+    'ratings': [['4.0', 'bad'], ['x']],
+}
+# mtime=0 keeps gzip output byte-for-byte reproducible
+COMPRESSED_WRITERS = {
+    'gzip': lambda path: gzip.GzipFile(path, 'wb', mtime=0),
+    'bz2': lambda path: bz2.BZ2File(path, 'wb'),
+    'xz': lambda path: lzma.LZMAFile(path, 'wb'),
+}
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic PoI file (CSV, JSON, NDJSON or XML) for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str, help='File to write, the format is taken from its extension (.gz, .bz2 and .xz compress it)')
+        parser.add_argument('--rows', type=int, default=100000, help='Number of records to write')
+        parser.add_argument('--seed', type=int, default=0, help='Same seed and options always give the same file')
+        parser.add_argument('--invalid-rate', type=float, default=0.001, help='Share of records with a broken id, coordinate or rating')
+        parser.add_argument('--duplicate-rate', type=float, default=0.001, help='Share of records that reuse an earlier id')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        if dataset_format(output) not in DATASET_WRITERS:
+            raise CommandError(f"Unsupported file type: '{output.split('.')[-1]}'")
+
+        write_dataset(output, options['rows'], options['seed'], options['invalid_rate'], options['duplicate_rate'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['rows']} records to {output} ({os.path.getsize(output):,} bytes)"))
+
+def dataset_format(output):
+    return split_compression(output)[0].split('.')[-1].lower()
+
+def write_dataset(output, rows, seed=0, invalid_rate=0.001, duplicate_rate=0.001):
+    records = generate_records(rows, seed, invalid_rate, duplicate_rate)
+    compression = split_compression(output)[1]
+    if compression:
+        file = io.TextIOWrapper(COMPRESSED_WRITERS[compression](output), encoding='utf-8', newline='')
+    else:
+        file = open(output, 'w', newline='', encoding='utf-8')
+    with file:
+        DATASET_WRITERS[dataset_format(output)](file, records)
+
+def generate_records(count, seed=0, invalid_rate=0.001, duplicate_rate=0.001):
+    # Streams records so 10M rows never have to be held in memory
+    rng = random.Random(seed)
+    for index in range(1, count + 1):
+        record = {
+            'id': index,
+            'name': f"Place {index}",
+            'category': f"category-{rng.randint(1, CATEGORIES)}",
+            'latitude': rng.uniform(-90, 90),
+            'longitude': rng.uniform(-180, 180),
+            'ratings': [round(rng.uniform(1, 5), 1) for _ in range(rng.randint(0, 8))],
+            'description': f"Description of place {index}",
+        }
+        if index > 1 and rng.random() < duplicate_rate:
+            record['id'] = rng.randint(1, index - 1)
+        if rng.random() < invalid_rate:
+            field = rng.choice(list(INVALID_VALUES))
+            record[field] = rng.choice(INVALID_VALUES[field])
+        yield record
+
+def write_csv(file, records):
+    # Same columns as the importers' RECORD_FIELDS, CSV carries no description
+    writer = csv.writer(file)
+    writer.writerow(["poi_id", "poi_name", "poi_category", "poi_latitude", "poi_longitude", "poi_ratings"])
+    for record in records:
+        writer.writerow([
+            record['id'], record['name'], record['category'], record['latitude'], record['longitude'],
+            '{' + ','.join(map(str, record['ratings'])) + '}',
+        ])
+
+def json_record(record):
+    return {
+        'id': record['id'],
+        'name': record['name'],
+        'coordinates': {'latitude': record['latitude'], 'longitude': record['longitude']},
+        'category': record['category'],
+        'ratings': record['ratings'],
+        'description': record['description'],
+    }
+
+def write_json(file, records):
+    file.write('[\n')
+    for index, record in enumerate(records):
+        if index:
+            file.write(',\n')
+        file.write(json.dumps(json_record(record)))
+    file.write('\n]\n')
+
+def write_ndjson(file, records):
+    for record in records:
+        file.write(json.dumps(json_record(record)))
+        file.write('\n')
+
+def write_xml(file, records):
+    file.write('<?xml version="1.0" encoding="UTF-8"?>\n<RECORDS>\n')
+    for record in records:
+        file.write(
+            f"<DATA_RECORD><pid>{escape(str(record['id']))}</pid><pname>{escape(record['name'])}</pname>"
+            f"<pcategory>{escape(record['category'])}</pcategory>"
+            f"<platitude>{escape(str(record['latitude']))}</platitude><plongitude>{escape(str(record['longitude']))}</plongitude>"
+            f"<pratings>{{{escape(','.join(map(str, record['ratings'])))}}}</pratings>"
+            f"<poi_description>{escape(record['description'])}</poi_description></DATA_RECORD>\n"
+        )
+    file.write('</RECORDS>\n')
+
+DATASET_WRITERS = {
+    'csv': write_csv,
+    'json': write_json,
+    'ndjson': write_ndjson,
+    'jsonl': write_ndjson,
+    'xml': write_xml,
+}
@@ -1,120 +1,206 @@
-import os
 import csv
-import json
 import time
 import threading
-import xml.etree.ElementTree as ET
 from queue import Queue
+from itertools import islice
+from django.db import connection, transaction
 from django.core.management.base import BaseCommand
 from geoDataImportApp.models import PointsOfInterest
-from django.core.exceptions import ValidationError
+from geoDataImportApp.querycache import bump_generation
+from geoDataImportApp.ratings import rating_columns
+from geoDataImportApp.search import index_staged_text_sql
+from geoDataImportApp.spatial import index_copied_points_sql, unindex_staged_points_sql
+from geoDataImportApp.stats import settle_category_stats, staged_stats_sql
+from geoDataImportApp.upsert import CREATE_TEMP_TABLE_SQL, POI_COLUMNS, POI_TEMP_TABLE, content_hash, insert_sql
+from geoDataImportApp.quarantine import Quarantine, parse_quarantine_target, report_rejections
+from geoDataImportApp.readers import find_import_files, get_file_format, iter_json_records, iter_xml_records, record_as_dict
+from geoDataImportApp.telemetry import ImportTelemetry, open_timed
+from geoDataImportApp.validation import valid_coordinates
 
 class Command(BaseCommand):
     help = 'Import Point of Interest data from files'
 
     def add_arguments(self, parser):
-        parser.add_argument('files', nargs='+', type=str, help='Path to file(s) to import')
+        parser.add_argument('files', nargs='+', type=str, help='Files, directories or glob patterns (quote them, e.g. "data/**/*.csv") to import')
+        parser.add_argument('--upsert', action='store_true', help='Update existing rows whose content hash changed instead of ignoring them')
+        parser.add_argument('--quarantine', type=parse_quarantine_target, default=None, help="Write rejected rows with file, row index and reason to a .csv/.ndjson file, or to the QuarantinedRow table with 'table'")
+        parser.add_argument('--report', type=str, default=None, help='Write a JSON report with per-stage timings, rejected rows and commit latencies to this path')
+        parser.add_argument('--profile', nargs='?', const='import_profile', default=None, help='Dump cProfile and tracemalloc snapshots of the hot loops into this directory')
 
     def handle(self, *args, **options):
         start_time = time.time()
-        db_queue = Queue()
-        main_loop_flag = threading.Event() 
-        db_thread = threading.Thread(target=save_to_database, args=(db_queue, main_loop_flag))
-        file_lock = threading.Lock()
-        for file_path in options['files']:
-            if not os.path.exists(file_path):
-                print(f"File '{file_path}' does not exist. Skipping...")
-                return
-            file_extension = file_path.split('.')[-1]
-            if file_extension not in ['csv', 'json', 'xml']:
-                print(f"Unsupported file type: '{file_extension}'. Skipping...")
-                return
-            threading.Thread(target=process_file, args=(file_path, db_queue, file_lock)).start()
+        telemetry = ImportTelemetry(options['profile'])
+        quarantine = Quarantine(options['quarantine'])
+        # The quarantine's writer thread isn't a daemon, it must be stopped even
+        # when the import fails
+        try:
+            table_rows_before = PointsOfInterest.objects.count()
+            db_queue = Queue()
+            main_loop_flag = threading.Event() 
+            db_thread = threading.Thread(target=save_to_database, args=(db_queue, main_loop_flag, telemetry, options['upsert']))
+            file_lock = threading.Lock()
+            file_threads = []
+            files, skipped = find_import_files(options['files'])
+            for message in skipped:
+                print(message)
+            for file_path, file_extension in files:
+                file_thread = threading.Thread(target=process_file, args=(file_path, db_queue, file_lock, telemetry, quarantine))
+                file_thread.start()
+                file_threads.append(file_thread)
         
-        db_thread.start()
-        main_loop_flag.wait()
+            telemetry.watch_queues([db_queue])
+            db_thread.start()
+            for file_thread in file_threads:
+                file_thread.join()
+            # The writer stops on this marker once every file has been queued
+            db_queue.put(None)
+            main_loop_flag.wait()
+        finally:
+            quarantine.close()
+        telemetry.finish()
+        if options['report']:
+            telemetry.write_report(
+                options['report'],
+                command='import_poi_data',
+                files=[file_path for file_path, _ in files],
+                skipped_files=skipped,
+                table_rows_before=table_rows_before,
+                table_rows_after=PointsOfInterest.objects.count(),
+            )
+            print(f"Report written to {options['report']}")
+        for line in report_rejections(telemetry, quarantine):
+            print(line)
         print(f"Processing took: {time.time() - start_time}")
 
-def process_file(file_path, db_queue, file_lock):
-    with file_lock:
-        file_extension = file_path.split('.')[-1]
+def process_file(file_path, db_queue, file_lock, telemetry, quarantine):
+    with file_lock, telemetry.profile('process_file'):
+        file_extension = get_file_format(file_path)
         batch_size = 50000
-        batch = []
-        with open(file_path, 'r', encoding='utf-8') as file:
-            if file_extension == 'csv':
-                reader = csv.DictReader(file)
-                data_origin = "csv"
-                for index, row in enumerate(reader):
-                    data = validate_and_create_point({
-                        'poi_id': row.get('poi_id'),
-                        'poi_name': row.get('poi_name'),
-                        'poi_latitude': row.get('poi_latitude'),
-                        'poi_longitude': row.get('poi_longitude'),
-                        'poi_category': row.get('poi_category'),
-                        'poi_ratings': row.get('poi_ratings'),
-                        'poi_description': ""
-                    }, index, data_origin)
-                    if data:
-                        batch.append(data)
-                    if len(batch) >= batch_size:
-                        db_queue.put(batch[:])
-                        batch.clear()
-
-            elif file_extension == 'json':
-                json_data = json.load(file)
-                data_origin = "json"
-                for index, item in enumerate(json_data):
-                    data = validate_and_create_point({
-                        'poi_id': item.get('id'),
-                        'poi_name': item.get('name'),
-                        'poi_latitude': item.get('coordinates', {}).get('latitude'),
-                        'poi_longitude': item.get('coordinates', {}).get('longitude'),
-                        'poi_category': item.get('category'),
-                        'poi_ratings': ','.join(map(str, item.get('ratings', []))),
-                        'poi_description': item.get('description', "")
-                    }, index, data_origin)
-                    if data:
-                        batch.append(data)
-                    if len(batch) >= batch_size:
-                        db_queue.put(batch[:])
-                        batch.clear()
-
-            elif file_extension == 'xml':
-                tree = ET.parse(file_path)
-                root = tree.getroot()
-                data_origin = "xml"
-                for index, record in enumerate(root.findall('DATA_RECORD')):                
-                    data = validate_and_create_point({
-                        'poi_id': record.find('pid').text,
-                        'poi_name': record.find('pname').text,
-                        'poi_latitude': record.find('platitude').text,
-                        'poi_longitude': record.find('plongitude').text,
-                        'poi_category': record.find('pcategory').text,
-                        'poi_ratings': record.find('pratings').text,
-                        'poi_description': record.find('poi_description').text if record.find('poi_description') is not None else ""
-                    }, index, data_origin)
-                    if data:
-                        batch.append(data)
-                    if len(batch) >= batch_size: 
-                        db_queue.put(batch[:])
-                        batch.clear()
-
-        if batch:
-            db_queue.put(batch[:])
-
-def save_to_database(db_queue, main_loop_flag):
+        try:
+            rows = enumerate(read_rows(file_path, file_extension, telemetry), start=1)
+            while True:
+                with telemetry.stage('parse'):
+                    raw_batch = list(islice(rows, batch_size))
+                if not raw_batch:
+                    break
+                telemetry.count('rows_read', len(raw_batch))
+
+                with telemetry.stage('validate'):
+                    batch = []
+                    rejections = []
+                    for index, row in raw_batch:
+                        data = validate_and_create_point(row, index, file_extension, rejections)
+                        if data:
+                            batch.append(data)
+                    telemetry.count('rows_valid', len(batch))
+                    for index, reason, row in rejections:
+                        telemetry.reject(reason)
+                    quarantine.add(file_path, rejections)
+                if batch:
+                    db_queue.put(batch)
+        except Exception as e:
+            # A broken file is skipped, the rows queued before the error are kept
+            print(f"Error reading '{file_path}': {e}. Skipping...")
+
+def read_rows(file_path, file_extension, telemetry):
+    if file_extension == 'csv':
+        with open_timed(file_path, telemetry, 'r') as file:
+            for row in csv.DictReader(file):
+                yield {
+                    'poi_id': row.get('poi_id'),
+                    'poi_name': row.get('poi_name'),
+                    'poi_latitude': row.get('poi_latitude'),
+                    'poi_longitude': row.get('poi_longitude'),
+                    'poi_category': row.get('poi_category'),
+                    'poi_ratings': row.get('poi_ratings'),
+                    'poi_description': ""
+                }
+
+    elif file_extension == 'json':
+        with open_timed(file_path, telemetry, 'r') as file:
+            for item in iter_json_records(file):
+                yield {
+                    'poi_id': item.get('id'),
+                    'poi_name': item.get('name'),
+                    'poi_latitude': item.get('coordinates', {}).get('latitude'),
+                    'poi_longitude': item.get('coordinates', {}).get('longitude'),
+                    'poi_category': item.get('category'),
+                    'poi_ratings': ','.join(map(str, item.get('ratings', []))),
+                    'poi_description': item.get('description', "")
+                }
+
+    elif file_extension == 'xml':
+        with open_timed(file_path, telemetry) as file:
+            yield from map(record_as_dict, iter_xml_records(file))
+
+def save_to_database(db_queue, main_loop_flag, telemetry, upsert=False):
     ## PRO-TIP DELETE THE DB, SAVE TIME
-    while True:
-        batch = db_queue.get()
-        if batch:
-            PointsOfInterest.objects.bulk_create(batch, ignore_conflicts=True)
-        db_queue.task_done()
-        if db_queue.empty():
-            main_loop_flag.set()
-            break 
+    with telemetry.profile('save_to_database'):
+        while True:
+            batch = db_queue.get()
+            if batch:
+                # Every batch is its own transaction, which also moves cached
+                # query results on to a new dataset generation. Like the writer's
+                # group commit, it is staged first so the R*Tree, the full-text
+                # index and the category stats only take in what it changes.
+                start_time = time.perf_counter()
+                with telemetry.stage('write'), transaction.atomic(), connection.cursor() as cursor:
+                    stage_points(cursor, batch, upsert)
+                    with telemetry.stage('index'):
+                        for sql in unindex_staged_points_sql(upsert) + index_staged_text_sql(upsert) + staged_stats_sql(upsert):
+                            cursor.execute(sql)
+                    if upsert:
+                        upsert_points(batch)
+                    else:
+                        PointsOfInterest.objects.bulk_create(batch, ignore_conflicts=True)
+                    with telemetry.stage('index'):
+                        cursor.execute(index_copied_points_sql())
+                        settle_category_stats(cursor)
+                    cursor.execute(f"DELETE FROM {POI_TEMP_TABLE}")
+                    bump_generation(cursor)
+                telemetry.commit(time.perf_counter() - start_time)
+            db_queue.task_done()
+            if batch is None:
+                main_loop_flag.set()
+                break 
+
+def stage_points(cursor, batch, upsert):
+    # The batch as rows of the writer's TEMP table, less the rows the main table
+    # would refuse (a missing description in an XML record), which bulk_create()
+    # skips too. In upsert mode the points get the content hash upsert_points()
+    # compares on.
+    if upsert:
+        for point in batch:
+            point.content_hash = content_hash(
+                point.poi_name, point.poi_latitude, point.poi_longitude, point.poi_category,
+                point.poi_ratings, point.poi_description, point.data_origin
+            )
+    cursor.execute(CREATE_TEMP_TABLE_SQL)
+    rows = [tuple(getattr(point, column) for column in POI_COLUMNS) for point in batch if point.poi_description is not None]
+    cursor.executemany(insert_sql(POI_TEMP_TABLE, upsert), rows if upsert else [row[:-1] for row in rows])
+
+def upsert_points(batch):
+    # The last occurrence of an id in the batch wins; of the ids already stored,
+    # only those whose content hash changed are written back
+    latest = {point.poi_id: point for point in batch}
 
+    poi_ids = list(latest)
+    stored_hashes = {}
+    for start in range(0, len(poi_ids), 900):
+        stored_hashes.update(
+            PointsOfInterest.objects.filter(poi_id__in=poi_ids[start:start + 900]).values_list('poi_id', 'content_hash')
+        )
 
-def validate_and_create_point(row, index, data_origin):
+    new_points = [point for poi_id, point in latest.items() if poi_id not in stored_hashes]
+    changed_points = [
+        point for poi_id, point in latest.items()
+        if poi_id in stored_hashes and stored_hashes[poi_id] != point.content_hash
+    ]
+    PointsOfInterest.objects.bulk_create(new_points, ignore_conflicts=True)
+    PointsOfInterest.objects.bulk_update(changed_points, POI_COLUMNS[1:], batch_size=1000)
+
+
+def validate_and_create_point(row, index, data_origin, rejections):
     poi_id = row.get('poi_id')
     poi_name = row.get('poi_name')
     poi_latitude = row.get('poi_latitude')
@@ -129,18 +215,23 @@ def validate_and_create_point(row, index, data_origin):
         poi_latitude = float(poi_latitude)
         poi_longitude = float(poi_longitude)
     except (TypeError, ValueError) as e:
-        print(ValidationError(f'Invalid data format on row {index}: {e}'))
+        rejections.append((index, 'invalid data format', row))
+        return
+
+    if not valid_coordinates(poi_latitude, poi_longitude):
+        rejections.append((index, 'invalid coordinates', row))
         return
 
     if not all([poi_id, poi_name, poi_latitude, poi_longitude, poi_category, poi_ratings]):
-        print(ValidationError(f'Missing required fields in row {index}'))
-        return 
+        rejections.append((index, 'missing required fields', row))
+        return
     
     try:
         ratings = [float(rating) for rating in poi_ratings.replace("{", "").replace("}", "").split(",") if rating.strip()]
-        average_rating = sum(ratings) / len(ratings)
-    except ZeroDivisionError:
-        average_rating = 0
+    except ValueError as e:
+        rejections.append((index, 'invalid ratings', row))
+        return
+    average_rating, rating_count, rating_sum, rating_min, rating_max, rating_values = rating_columns(ratings)
 
     return PointsOfInterest(
         poi_id=poi_id,
@@ -151,5 +242,10 @@ def validate_and_create_point(row, index, data_origin):
         poi_ratings=poi_ratings,
         poi_description=poi_description,
         data_origin=data_origin,
-        average_rating=average_rating
+        average_rating=average_rating,
+        rating_count=rating_count,
+        rating_sum=rating_sum,
+        rating_min=rating_min,
+        rating_max=rating_max,
+        rating_values=rating_values
     )
\ No newline at end of file
@@ -1,13 +1,20 @@
-import os
 import csv
-import json
 import time
 import threading
-import sqlite3
-import xml.etree.ElementTree as ET
-from queue import Queue
-from django.core.management.base import BaseCommand
+from queue import Empty, Queue
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
 from geoDataImportApp.models import PointsOfInterest
+from geoDataImportApp.pipeline import DEFAULT_FILE_WORKERS, DEFAULT_QUEUE_DEPTH, MemoryBudget, PipelineQueue, RowBatch, parse_size, queue_stalls, report_stalls
+from geoDataImportApp.ratings import parse_ratings, rating_columns
+from geoDataImportApp.quarantine import Quarantine, parse_quarantine_target, report_rejections
+from geoDataImportApp.readers import (
+    POI_CATEGORY, POI_DESCRIPTION, POI_ID, POI_LATITUDE, POI_LONGITUDE, POI_NAME, POI_RATINGS,
+    find_import_files, get_file_format, iter_json_records, iter_xml_records, json_record, record_as_dict,
+)
+from geoDataImportApp.telemetry import ImportTelemetry, open_timed
+from geoDataImportApp.validation import has_required_fields, rejection_reason, valid_coordinates
+from geoDataImportApp.writer import COMMIT_INTERVAL, COMMIT_ROWS, describe_failures, parse_interval, save_to_database
 
 class Command(BaseCommand):
     # This is a highly optimised vesrion of the 2 hour code task
@@ -18,193 +25,163 @@ class Command(BaseCommand):
     help = 'Import Point of Interest data from files'
 
     def add_arguments(self, parser):
-        parser.add_argument('files', nargs='+', type=str, help='Path to file(s) to import')
+        parser.add_argument('files', nargs='+', type=str, help='Files, directories or glob patterns (quote them, e.g. "data/**/*.csv") to import')
+        parser.add_argument('--upsert', action='store_true', help='Update existing rows whose content hash changed instead of ignoring them')
+        parser.add_argument('--file-workers', type=int, default=DEFAULT_FILE_WORKERS, help='Number of files read at the same time, largest first, each reader with its own validator thread')
+        parser.add_argument('--queue-depth', type=int, default=DEFAULT_QUEUE_DEPTH, help='Maximum number of batches waiting between two stages (0 for unbounded)')
+        parser.add_argument('--max-memory', type=parse_size, default=None, help='Memory budget for batches queued between stages, e.g. 512M; readers are throttled when it is reached')
+        parser.add_argument('--commit-rows', type=int, default=COMMIT_ROWS, help='Commit once this many rows are staged')
+        parser.add_argument('--commit-interval', type=parse_interval, default=COMMIT_INTERVAL, help='Commit staged rows at least this often, in seconds')
+        parser.add_argument('--quarantine', type=parse_quarantine_target, default=None, help="Write rejected rows with file, row index and reason to a .csv/.ndjson file, or to the QuarantinedRow table with 'table'")
+        parser.add_argument('--report', type=str, default=None, help='Write a JSON report with per-stage timings, rejected rows and commit latencies to this path')
+        parser.add_argument('--profile', nargs='?', const='import_profile', default=None, help='Dump cProfile and tracemalloc snapshots of the hot loops into this directory')
 
     def handle(self, *args, **options):
         start_time = time.time()
-        db_queue = Queue()
-        data_queue = Queue()
-        main_loop_flag = threading.Event()
-        file_lock = threading.Lock()    
-        checkout_flag = threading.Lock()
-        threads = []
-
-        for file_path in options['files']:
-            if not os.path.exists(file_path):
-                print(f"File '{file_path}' does not exist. Skipping...")
-                return
-            file_extension = file_path.split('.')[-1]
-            if file_extension not in ['csv', 'json', 'xml']:
-                print(f"Unsupported file type: '{file_extension}'. Skipping...")
-                return
-            file_thread = threading.Thread(target=process_file, args=(file_path, file_lock, file_extension, data_queue, main_loop_flag))
-            data_thread = threading.Thread(target=validate_and_create_point, args=(data_queue, db_queue, file_extension, main_loop_flag))
-            db_thread = threading.Thread(target=save_to_database, args=(db_queue, checkout_flag))
-            threads.append(file_thread)
-            threads.append(db_thread)
-            threads.append(data_thread)
-        
-        for thread in threads:
-            thread.start()
-
-        for thread in threads:
-            thread.join()
-
-        main_loop_flag.set()    
-
+        telemetry = ImportTelemetry(options['profile'])
+        quarantine = Quarantine(options['quarantine'])
+        try:
+            table_rows_before = PointsOfInterest.objects.count()
+            budget = MemoryBudget(options['max_memory']) if options['max_memory'] else None
+            data_queue = PipelineQueue('read -> validate', options['queue_depth'], budget)
+            db_queue = PipelineQueue('validate -> write', options['queue_depth'], budget)
+            threads = []
+            failed = []
+
+            files, skipped = find_import_files(options['files'])
+            for message in skipped:
+                print(message)
+
+            # Files waiting for a reader, largest first
+            file_queue = Queue()
+            for file_path, file_extension in files:
+                file_queue.put((file_path, file_extension))
+
+            # Readers and validators come in pairs, so there are as many end markers
+            # as validators, and the writer stops once each validator has sent its own
+            workers = max(1, min(options['file_workers'], len(files)))
+            for _ in range(workers):
+                threads.append(threading.Thread(target=process_files, args=(file_queue, data_queue, telemetry, failed)))
+                threads.append(threading.Thread(target=validate_and_create_point, args=(data_queue, db_queue, telemetry, quarantine)))
+            threads.append(threading.Thread(target=save_to_database, args=(db_queue, workers, telemetry, options['upsert'], options['commit_rows'], options['commit_interval'], failed)))
+
+            telemetry.watch_queues([data_queue, db_queue])
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+        finally:
+            quarantine.close()
+        telemetry.finish()
+        if options['report']:
+            telemetry.write_report(
+                options['report'],
+                command='import_poi_data_fast',
+                files=[file_path for file_path, _ in files],
+                skipped_files=skipped,
+                failed_files=failed,
+                queue_stalls=queue_stalls([data_queue, db_queue]),
+                table_rows_before=table_rows_before,
+                table_rows_after=PointsOfInterest.objects.count(),
+            )
+            print(f"Report written to {options['report']}")
+        for line in report_rejections(telemetry, quarantine) + report_stalls([data_queue, db_queue]):
+            print(line)
         print(f"Processing took: {time.time() - start_time}")
+        if failed:
+            raise CommandError(describe_failures(failed))
         print("Finished execution")
 
-def process_file(file_path, file_lock, file_extension, data_queue, main_loop_flag):
-    with file_lock:
-        data_batch = []
-        main_loop_flag.set()
-
-        if file_extension == 'csv':
-            with open(file_path, 'r', newline='', encoding='utf-8') as file:
-                reader = csv.DictReader(file, fieldnames=["poi_id","poi_name","poi_category","poi_latitude","poi_longitude","poi_ratings"])
-                for index, row in enumerate(reader, start=1):
-                    data_batch.append(row)
-                    if index % 100000 == 0:
-                        data_queue.put(data_batch[:])
-                        data_batch.clear()
-
-        elif file_extension == 'json':
-            with open(file_path, 'r', encoding='utf-8') as file:
-                json_data = json.load(file)
-                for index, item in enumerate(json_data, start=1):
-                    data = {
-                        'poi_id': item.get('id'),
-                        'poi_name': item.get('name'),
-                        'poi_latitude': item.get('coordinates', {}).get('latitude'),
-                        'poi_longitude': item.get('coordinates', {}).get('longitude'),
-                        'poi_category': item.get('category'),
-                        'poi_ratings': ','.join(map(str, item.get('ratings', []))),
-                        'poi_description': item.get('description', "")
-                    }
-                    data_batch.append(data)
-                    if index % 100000 == 0:
-                        data_queue.put(data_batch[:])
-                        data_batch.clear()
-                    
-
-        elif file_extension == 'xml':
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            for index, record in enumerate(root.findall('DATA_RECORD'), start=1):                
-                data = {
-                    'poi_id': record.find('pid').text,
-                    'poi_name': record.find('pname').text,
-                    'poi_latitude': record.find('platitude').text,
-                    'poi_longitude': record.find('plongitude').text,
-                    'poi_category': record.find('pcategory').text,
-                    'poi_ratings': record.find('pratings').text,
-                    'poi_description': record.find('poi_description').text if record.find('poi_description') is not None else ""
-                }
-                data_batch.append(data)
-                if index % 100000 == 0:
-                    data_queue.put(data_batch[:])
-                    data_batch.clear()
-        
-        if len(data_batch) > 0:
-            data_queue.put(data_batch[:])
-            data_batch.clear()
-        
-        main_loop_flag.clear()
-
-def save_to_database(db_queue, checkout_flag):
-    conn = sqlite3.connect(r".\db.sqlite3")
-    cursor = conn.cursor()
-    cursor.execute("PRAGMA journal_mode = WAL;")
-    cursor.execute("PRAGMA synchronous = OFF;")
-    cursor.execute("PRAGMA cache_size = 1000000;")
-    cursor.execute("PRAGMA temp_store = MEMORY;")
-    cursor.execute("""CREATE TEMPORARY TABLE IF NOT EXISTS geoDataImportApp_pointsofinterest_temp (
-                poi_id INTEGER UNIQUE PRIMARY KEY, 
-                poi_name VARCHAR,
-                poi_latitude REAL, 
-                poi_longitude REAL,
-                poi_category VARCHAR, 
-                poi_ratings TEXT,
-                poi_description TEXT, 
-                data_origin VARCHAR,
-                average_rating REAL)""")
-
-    conn.commit()
+def process_files(file_queue, data_queue, telemetry, failed):
+    # One of the --file-workers readers, it takes files off the shared queue until
+    # none are left. A file that fails part way is reported and skipped, the rows
+    # it queued before failing are still written.
     while True:
-        batch = db_queue.get()
-        if batch:
-            try:
-                values = [
-                    (
-                        obj.poi_id, obj.poi_name, obj.poi_latitude, obj.poi_longitude,
-                        obj.poi_category, obj.poi_ratings, obj.poi_description,
-                        obj.data_origin, obj.average_rating
-                    )
-                    for obj in batch
-                ]
-
-                # Bulk insert operation
-                cursor.executemany(
-                    "INSERT OR IGNORE INTO geoDataImportApp_pointsofinterest_temp "
-                    "(poi_id, poi_name, poi_latitude, poi_longitude, "
-                    "poi_category, poi_ratings, poi_description, "
-                    "data_origin, average_rating) "
-                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    values
-                )
-            except Exception as e:
-                print(f"Error inserting data: {e}")
-
-        db_queue.task_done()
-        if db_queue.empty():
-            # When the queue is empty, transfer data from temporary table to main table
-            cursor.execute("""
-                INSERT OR IGNORE INTO geoDataImportApp_pointsofinterest
-                SELECT * FROM geoDataImportApp_pointsofinterest_temp;
-            """)
-            conn.commit()
+        try:
+            file_path, file_extension = file_queue.get_nowait()
+        except Empty:
             break
-
-    cursor.close()
-    conn.close()
-
-def validate_and_create_point(data_queue, db_queue, data_origin, main_loop_flag):
-    while True:
-        batch = data_queue.get()
-        if batch:
-            points_of_interest = []
-            for row in batch:
-                try:
-                    poi_ratings_calc = [float(rating) for rating in row['poi_ratings'].strip('{}').split(',') if rating.strip()]
-
-                    poi_id = int(row['poi_id'])
-                    poi_name = row['poi_name']
-                    poi_latitude = float(row['poi_latitude'])
-                    poi_longitude = float(row['poi_longitude'])
-                    poi_category = row['poi_category']
-                    poi_ratings = row['poi_ratings']
-                    poi_description = row.get('poi_description', "")
-                    average_rating = sum(poi_ratings_calc) / len(poi_ratings_calc) if poi_ratings_calc else 0
-                    
-                    poi = PointsOfInterest(
-                        poi_id=poi_id,
-                        poi_name=poi_name,
-                        poi_latitude=poi_latitude,
-                        poi_longitude=poi_longitude,
-                        poi_category=poi_category,
-                        poi_ratings=poi_ratings,
-                        poi_description=poi_description,
-                        data_origin=data_origin,
-                        average_rating=average_rating
-                    )
-                    
-                    points_of_interest.append(poi)
-                    
-                except (TypeError, ValueError) as e:
-                    continue
-            db_queue.put(points_of_interest[:])
-            points_of_interest.clear()
+        try:
+            process_file(file_path, file_extension, data_queue, telemetry)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping...")
+            failed.append((file_path, str(e)))
+
+    # End-of-stream marker, one per reader, so every validator gets exactly one
+    data_queue.put(None)
+
+def process_file(file_path, file_extension, data_queue, telemetry):
+    with telemetry.profile('process_file'):
+        rows = read_rows(file_path, file_extension, telemetry)
+        index = 1
+        while True:
+            with telemetry.stage('parse'):
+                data_batch = RowBatch(islice(rows, 100000), file_path, index)
+            if not data_batch:
+                break
+            index += len(data_batch)
+            telemetry.count('rows_read', len(data_batch))
+            data_queue.put(data_batch)
+
+def read_rows(file_path, file_extension, telemetry):
+    if file_extension == 'csv':
+        with open_timed(file_path, telemetry, 'r', newline='') as file:
+            # csv.reader's lists are already records, blank lines are dropped like DictReader did
+            rows = filter(None, csv.reader(file))
+            # The header names the columns, it is not a record
+            next(rows, None)
+            yield from rows
+
+    elif file_extension == 'json':
+        with open_timed(file_path, telemetry, 'r') as file:
+            yield from map(json_record, iter_json_records(file))
+
+    elif file_extension == 'xml':
+        with open_timed(file_path, telemetry) as file:
+            yield from iter_xml_records(file)
+
+def validate_and_create_point(data_queue, db_queue, telemetry, quarantine):
+    with telemetry.profile('validate_and_create_point'):
+        while True:
+            batch = data_queue.get()
+            if batch:
+                # Any worker can get any file's batch, so the origin comes with the batch
+                data_origin = get_file_format(batch.file_path)
+                with telemetry.stage('validate'):
+                    # Rows go to the writer as plain tuples, in insert column order
+                    points_of_interest = []
+                    rejections = []
+                    for index, row in enumerate(batch, start=batch.first_index):
+                        try:
+                            poi_ratings = row[POI_RATINGS]
+                            poi_ratings_calc = parse_ratings(poi_ratings)
+
+                            poi_id = int(row[POI_ID])
+                            poi_name = row[POI_NAME]
+                            poi_latitude = float(row[POI_LATITUDE])
+                            poi_longitude = float(row[POI_LONGITUDE])
+                            poi_category = row[POI_CATEGORY]
+                            poi_description = row[POI_DESCRIPTION] if len(row) > POI_DESCRIPTION else ""
+                            if not valid_coordinates(poi_latitude, poi_longitude):
+                                raise ValueError("coordinates out of range")
+                            if not has_required_fields(poi_name, poi_category, poi_description):
+                                raise ValueError("missing required fields")
+
+                            points_of_interest.append((
+                                poi_id, poi_name, poi_latitude, poi_longitude, poi_category,
+                                poi_ratings, poi_description, data_origin
+                            ) + rating_columns(poi_ratings_calc))
+
+                        except (TypeError, ValueError, AttributeError, IndexError) as e:
+                            reason = rejection_reason(row)
+                            telemetry.reject(reason)
+                            rejections.append((index, reason, record_as_dict(row)))
+                            continue
+                    telemetry.count('rows_valid', len(points_of_interest))
+                    quarantine.add(batch.file_path, rejections)
+                db_queue.put(points_of_interest)
             data_queue.task_done()
-            if data_queue.empty() and not main_loop_flag.is_set():
-                break
\ No newline at end of file
+            if batch is None:
+                db_queue.put(None)
+                break
@@ -1,164 +1,348 @@
+import io
 import os
 import csv
-import json
 import time
 import threading
 import sqlite3
-import xml.etree.ElementTree as ET
-from queue import Queue
-from django.core.management.base import BaseCommand
+from queue import Empty, Queue
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from geoDataImportApp.manifest import ImportCheckpoint, load_manifest
+from geoDataImportApp.models import PointsOfInterest
+from geoDataImportApp.pipeline import DEFAULT_FILE_WORKERS, DEFAULT_QUEUE_DEPTH, MemoryBudget, PipelineQueue, parse_size, queue_stalls, report_stalls
+from geoDataImportApp.ratings import parse_ratings, rating_columns
+from geoDataImportApp.quarantine import Quarantine, parse_quarantine_target, report_rejections
+from geoDataImportApp.shadow import POI_SHADOW_TABLE, create_shadow_table, drop_shadow_table, swap_shadow_table
+from geoDataImportApp.upsert import complete_rows, insert_sql, with_content_hash
+from geoDataImportApp.readers import (
+    POI_CATEGORY, POI_DESCRIPTION, POI_ID, POI_LATITUDE, POI_LONGITUDE, POI_NAME, POI_RATINGS,
+    find_import_files, get_compression, iter_json_records, iter_xml_records, json_record, record_as_dict, seek_forward,
+)
+from geoDataImportApp.telemetry import ImportTelemetry, open_timed
+from geoDataImportApp.validation import has_required_fields, rejection_reason, valid_coordinates, validate_batch
+from geoDataImportApp.writer import COMMIT_INTERVAL, COMMIT_ROWS, describe_failures, parse_interval, save_to_database
+
+CSV_SHARD_SIZE = 8 * 1024 * 1024
 
 class Command(BaseCommand):
     help = 'Import Point of Interest data from files'
 
     def add_arguments(self, parser):
-        parser.add_argument('files', nargs='+', type=str, help='Path to file(s) to import')
+        parser.add_argument('files', nargs='+', type=str, help='Files, directories or glob patterns (quote them, e.g. "data/**/*.csv") to import')
+        parser.add_argument('--file-workers', type=int, default=DEFAULT_FILE_WORKERS, help='Number of files read at the same time, largest first, all feeding one writer')
+        parser.add_argument('--commit-rows', type=int, default=COMMIT_ROWS, help='Commit once this many rows are staged')
+        parser.add_argument('--commit-interval', type=parse_interval, default=COMMIT_INTERVAL, help='Commit staged rows at least this often, in seconds')
+        parser.add_argument('--upsert', action='store_true', help='Update existing rows whose content hash changed instead of ignoring them')
+        parser.add_argument('--workers', type=int, default=1, help='Number of processes used to parse and validate CSV files in byte-range shards')
+        parser.add_argument('--vectorised', action='store_true', help='Validate whole batches column-wise with NumPy instead of row by row')
+        parser.add_argument('--force', action='store_true', help='Re-import files from the start even if the manifest says they are unchanged or partly done')
+        parser.add_argument('--queue-depth', type=int, default=DEFAULT_QUEUE_DEPTH, help='Maximum number of batches waiting between two stages (0 for unbounded)')
+        parser.add_argument('--max-memory', type=parse_size, default=None, help='Memory budget for batches queued between stages, e.g. 512M; readers are throttled when it is reached')
+        parser.add_argument('--full-refresh', action='store_true', help='Replace the whole table with the given files, loaded into a shadow table that is swapped in at the end')
+        parser.add_argument('--quarantine', type=parse_quarantine_target, default=None, help="Write rejected rows with file, row index and reason to a .csv/.ndjson file, or to the QuarantinedRow table with 'table'")
+        parser.add_argument('--report', type=str, default=None, help='Write a JSON report with per-stage timings, rejected rows and commit latencies to this path')
+        parser.add_argument('--profile', nargs='?', const='import_profile', default=None, help='Dump cProfile and tracemalloc snapshots of the hot loops into this directory')
 
     def handle(self, *args, **options):
         start_time = time.time()
-        db_queue = Queue()
-        main_loop_flag = threading.Event()
-        file_lock = threading.Lock()    
-        checkout_flag = threading.Lock()
-        threads = []
-
-        for file_path in options['files']:
-            if not os.path.exists(file_path):
-                print(f"File '{file_path}' does not exist. Skipping...")
-                return
-            file_extension = file_path.split('.')[-1]
-            if file_extension not in ['csv', 'json', 'xml']:
-                print(f"Unsupported file type: '{file_extension}'. Skipping...")
-                return
-            file_thread = threading.Thread(target=process_file, args=(file_path, file_lock, file_extension, db_queue, main_loop_flag))
-            db_thread = threading.Thread(target=save_to_database, args=(db_queue, checkout_flag))
-            threads.append(file_thread)
-            threads.append(db_thread)
-        
-        for thread in threads:
-            thread.start()
+        telemetry = ImportTelemetry(options['profile'])
+        quarantine = Quarantine(options['quarantine'])
+        try:
+            table_rows_before = PointsOfInterest.objects.count()
+            threads = []
+            # A worker started with spawn (the default outside Linux) imports this
+            # module, and the models with it, before Django is set up
+            executor = ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) if options['workers'] > 1 else None
+            budget = MemoryBudget(options['max_memory']) if options['max_memory'] else None
+            # Every reader feeds one queue and a single writer, the shadow table writer in a full refresh
+            db_queue = PipelineQueue('read -> write', options['queue_depth'], budget)
+
+            files, skipped = find_import_files(options['files'])
+            for message in skipped:
+                print(message)
+
+            # Files waiting for a reader, largest first
+            file_queue = Queue()
+            for file_path, file_extension in files:
+                manifest = load_manifest(file_path, force=options['force'] or options['full_refresh'])
+                if manifest.completed:
+                    print(f"File '{file_path}' is unchanged since its last import. Skipping...")
+                    continue
+                if manifest.committed_rows or manifest.committed_offset:
+                    print(f"Resuming '{file_path}' after row {manifest.committed_rows}")
+                file_queue.put((file_path, file_extension, manifest))
+
+            failed = []
+            for _ in range(max(1, min(options['file_workers'], file_queue.qsize()))):
+                threads.append(threading.Thread(target=process_files, args=(file_queue, db_queue, executor, options['workers'], telemetry, quarantine, failed, options['vectorised'])))
 
-        for thread in threads:
-            thread.join()
+            if options['full_refresh']:
+                threads.append(threading.Thread(target=save_to_shadow_table, args=(db_queue, len(threads), telemetry, options['upsert'], failed, skipped)))
+            else:
+                threads.append(threading.Thread(target=save_to_database, args=(db_queue, len(threads), telemetry, options['upsert'], options['commit_rows'], options['commit_interval'], failed)))
 
+            telemetry.watch_queues([db_queue])
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+            if executor:
+                executor.shutdown()
+        finally:
+            quarantine.close()
+        telemetry.finish()
+        if options['report']:
+            telemetry.write_report(
+                options['report'],
+                command='import_poi_data_lightning',
+                files=[file_path for file_path, _ in files],
+                skipped_files=skipped,
+                failed_files=failed,
+                queue_stalls=queue_stalls([db_queue]),
+                table_rows_before=table_rows_before,
+                table_rows_after=PointsOfInterest.objects.count(),
+            )
+            self.stdout.write(f"Report written to {options['report']}")
+        for line in report_rejections(telemetry, quarantine) + report_stalls([db_queue]):
+            self.stdout.write(line)
         self.stdout.write(self.style.SUCCESS(f"Processing took: {time.time() - start_time}"))
+        if failed:
+            raise CommandError(describe_failures(failed))
         self.stdout.write(self.style.SUCCESS(f"Finished Execution"))
 
-def process_file(file_path, file_lock, file_extension, db_queue, main_loop_flag):
-    with file_lock:
-        data_batch = [] * 10000
-        if file_extension == 'csv':
-            reader = csv.DictReader(open(file_path, encoding='utf-8'),fieldnames=["poi_id","poi_name","poi_category","poi_latitude","poi_longitude","poi_ratings"])
+def process_files(file_queue, db_queue, executor, workers, telemetry, quarantine, failed, vectorised=False):
+    # One of the --file-workers readers, it takes files off the shared queue until
+    # none are left. A file that fails part way is reported and skipped, whatever
+    # it queued before failing is still committed with its last checkpoint.
+    while True:
+        try:
+            file_path, file_extension, manifest = file_queue.get_nowait()
+        except Empty:
+            break
+        try:
+            # Byte-range shards need random access, compressed CSV is read as one stream
+            if executor and file_extension == 'csv' and not get_compression(file_path):
+                process_csv_sharded(file_path, executor, workers, db_queue, manifest, telemetry, quarantine, vectorised)
+            else:
+                process_file(file_path, file_extension, db_queue, manifest, telemetry, quarantine, vectorised)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping...")
+            failed.append((file_path, str(e)))
+
+    # End-of-stream marker, the writer finishes once it has one from every reader
+    db_queue.put(None)
 
-            for index, row in enumerate(reader, start=1):
-                validated_row = validate_and_create_point(row, file_extension)
-                if validated_row:
-                    data_batch.append(validated_row)
-                if index % 10000 == 0:
-                    db_queue.put(data_batch[:])
-                    data_batch.clear()
-
-        elif file_extension == 'json':
-            json_data = json.load(open(file_path, 'r', encoding='utf-8'))
-            for index, row in enumerate(json_data):
-                validated_row = validate_and_create_point({
-                        'poi_id': row.get('id'),
-                        'poi_name': row.get('name'),
-                        'poi_latitude': row.get('coordinates', {}).get('latitude'),
-                        'poi_longitude': row.get('coordinates', {}).get('longitude'),
-                        'poi_category': row.get('category'),
-                        'poi_ratings': ','.join(map(str, row.get('ratings', []))),
-                        'poi_description': row.get('description', "")
-                    }, file_extension)
-                if validated_row:
-                    data_batch.append(validated_row)
-                if index % 10000 == 0:
-                    db_queue.put(data_batch[:])
-                    data_batch.clear()  
-
-        elif file_extension == 'xml':
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            for index, record in enumerate(root.findall('DATA_RECORD'), start=1):                
-                validated_row = validate_and_create_point({
-                    'poi_id': record.find('pid').text,
-                    'poi_name': record.find('pname').text,
-                    'poi_latitude': record.find('platitude').text,
-                    'poi_longitude': record.find('plongitude').text,
-                    'poi_category': record.find('pcategory').text,
-                    'poi_ratings': record.find('pratings').text,
-                    'poi_description': record.find('poi_description').text if record.find('poi_description') is not None else ""
-                }, file_extension)
+def process_file(file_path, file_extension, db_queue, manifest, telemetry, quarantine, vectorised=False):
+    with telemetry.profile('process_file'):
+        # CSV resumes by seeking to the last committed byte offset, JSON and XML
+        # by skipping the rows that were already committed
+        position = {'offset': manifest.committed_offset if file_extension == 'csv' else None}
+        rows = read_rows(file_path, file_extension, position, telemetry)
+        if file_extension != 'csv':
+            rows = islice(rows, manifest.committed_rows, None)
+
+        index = manifest.committed_rows
+        while True:
+            with telemetry.stage('parse'):
+                raw_batch = list(islice(rows, 10000))
+            if not raw_batch:
+                break
+            data_batch, rejections = validate_rows(raw_batch, file_extension, telemetry, vectorised, index + 1)
+            quarantine.add(file_path, rejections)
+            index += len(raw_batch)
+            db_queue.put(data_batch)
+            db_queue.put(ImportCheckpoint(file_path, position['offset'], index, False))
+
+        db_queue.put(ImportCheckpoint(file_path, position['offset'], index, True))
+
+def validate_rows(rows, data_origin, telemetry, vectorised=False, first_index=1):
+    # Returns the valid rows and (row index, reason, row) for every rejected one
+    with telemetry.stage('validate'):
+        rejected = []
+        if vectorised:
+            data_batch = validate_batch(rows, data_origin, rejected)
+        else:
+            data_batch = []
+            for index, row in enumerate(rows):
+                validated_row = validate_and_create_point(row, data_origin)
                 if validated_row:
                     data_batch.append(validated_row)
-                if index % 10000 == 0:
-                    db_queue.put(data_batch[:])
-                    data_batch.clear()  
-        
-        if len(data_batch) > 0:
-            db_queue.put(data_batch[:])
-            data_batch.clear()
+                else:
+                    rejected.append(index)
 
-def save_to_database(db_queue, checkout_flag):
-    conn = sqlite3.connect(r".\db.sqlite3")
+        telemetry.count('rows_read', len(rows))
+        telemetry.count('rows_valid', len(data_batch))
+        rejections = []
+        for index in rejected:
+            reason = rejection_reason(rows[index])
+            telemetry.reject(reason)
+            rejections.append((first_index + index, reason, record_as_dict(rows[index])))
+        return data_batch, rejections
+
+def read_rows(file_path, file_extension, position, telemetry):
+    if file_extension == 'csv':
+        with open_timed(file_path, telemetry) as file:
+            header = not position['offset']
+            seek_forward(file, position['offset'])
+            # csv.reader's lists are already records, blank lines are dropped like DictReader did
+            rows = filter(None, csv.reader(read_lines(file, position)))
+            if header:
+                # The header names the columns, it is not a record
+                next(rows, None)
+            yield from rows
+
+    elif file_extension == 'json':
+        with open_timed(file_path, telemetry, 'r') as file:
+            yield from map(json_record, iter_json_records(file))
+
+    elif file_extension == 'xml':
+        with open_timed(file_path, telemetry) as file:
+            yield from iter_xml_records(file)
+
+def read_lines(file, position):
+    # Keeps position['offset'] at the end of the last line handed to the CSV reader
+    for line in file:
+        position['offset'] += len(line)
+        yield line.decode('utf-8')
+
+def process_csv_sharded(file_path, executor, workers, db_queue, manifest, telemetry, quarantine, vectorised=False):
+    # Shards are parsed and validated in worker processes and their results are
+    # queued in file order, so duplicate ids resolve as in process_file. Only a
+    # couple of shards per worker are in flight, so a slow writer holds back
+    # the pool instead of finished shards piling up in memory.
+    with telemetry.profile('process_csv_sharded'):
+        pending = deque()
+        # Rows seen in earlier shards and runs, so rejected rows get an index
+        # within the file and checkpoints a row count to resume from
+        position = {'rows': manifest.committed_rows}
+        for start, end in find_csv_shards(file_path, workers, manifest.committed_offset):
+            pending.append((end, executor.submit(process_csv_shard, file_path, start, end, vectorised)))
+            if len(pending) > 2 * workers:
+                queue_csv_shard(file_path, db_queue, telemetry, quarantine, position, *pending.popleft())
+        while pending:
+            queue_csv_shard(file_path, db_queue, telemetry, quarantine, position, *pending.popleft())
+
+        db_queue.put(ImportCheckpoint(file_path, None, position['rows'], True))
+
+def queue_csv_shard(file_path, db_queue, telemetry, quarantine, position, end, future):
+    data_batch, shard_telemetry, rejections = future.result()
+    telemetry.merge(shard_telemetry)
+    quarantine.add(file_path, [(position['rows'] + index, reason, row) for index, reason, row in rejections])
+    position['rows'] += shard_telemetry['counters'].get('rows_read', 0)
+    if data_batch:
+        db_queue.put(data_batch)
+    db_queue.put(ImportCheckpoint(file_path, end, position['rows'], False))
+
+def find_csv_shards(file_path, workers, start=0):
+    # Splits the file into byte ranges that each start at the beginning of a line.
+    # Quoted fields spanning several lines are not supported in this mode.
+    size = os.path.getsize(file_path)
+    shard_count = max(workers, (size - start) // CSV_SHARD_SIZE)
+    boundaries = [start]
+    with open(file_path, 'rb') as file:
+        for shard in range(1, shard_count):
+            offset = start + (size - start) * shard // shard_count
+            if offset <= boundaries[-1]:
+                continue
+            file.seek(offset)
+            file.readline()
+            boundaries.append(file.tell())
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+def process_csv_shard(file_path, start, end, vectorised=False):
+    # Runs in a worker process, its telemetry goes back to the parent with the rows
+    telemetry = ImportTelemetry()
+    with telemetry.stage('read'), open(file_path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    with telemetry.stage('parse'):
+        rows = list(filter(None, csv.reader(io.StringIO(data.decode('utf-8')))))
+        if not start:
+            # The first shard starts with the header, which is not a record
+            rows = rows[1:]
+    data_batch, rejections = validate_rows(rows, 'csv', telemetry, vectorised)
+    return data_batch, telemetry.snapshot(), rejections
+
+def save_to_shadow_table(db_queue, reader_count, telemetry, upsert, failed, skipped):
+    # Full refresh: every file is loaded straight into an index-free shadow copy
+    # of the table, which replaces the live table only once all files are done.
+    # It is dropped instead if a file could not be read (the readers add to
+    # failed before their end marker) or an argument was skipped, and the
+    # refresh is reported as failed.
+    conn = sqlite3.connect(settings.DATABASES['default']['NAME'])
     cursor = conn.cursor()
     cursor.execute("PRAGMA journal_mode = WAL;")
     cursor.execute("PRAGMA synchronous = OFF;")
     cursor.execute("PRAGMA cache_size = 1000000;")
-    cursor.execute("PRAGMA temp_store = MEMORY;")
-    cursor.execute("""CREATE TEMPORARY TABLE IF NOT EXISTS geoDataImportApp_pointsofinterest_temp (
-                poi_id INTEGER UNIQUE PRIMARY KEY, 
-                poi_name VARCHAR,
-                poi_latitude REAL, 
-                poi_longitude REAL,
-                poi_category VARCHAR, 
-                poi_ratings TEXT,
-                poi_description TEXT, 
-                data_origin VARCHAR,
-                average_rating REAL)""")
-
+    create_shadow_table(cursor)
     conn.commit()
-    while True:
-        batch = db_queue.get()
-        if batch:
-            try:        
-                cursor.executemany(
-                    "INSERT OR IGNORE INTO geoDataImportApp_pointsofinterest_temp "
-                    "(poi_id, poi_name, poi_latitude, poi_longitude, "
-                    "poi_category, poi_ratings, poi_description, "
-                    "data_origin, average_rating) "
-                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    batch
-                )
-            except Exception as e:
-                print(f"Error inserting data: {e}")
-
-        db_queue.task_done()
-        if db_queue.empty():
-            cursor.execute("""
-                INSERT OR IGNORE INTO geoDataImportApp_pointsofinterest
-                SELECT * FROM geoDataImportApp_pointsofinterest_temp;
-            """)
-            conn.commit()
-            break
 
+    insert = insert_sql(POI_SHADOW_TABLE, upsert)
+    completed = []
+    error = None
+    with telemetry.profile('save_to_shadow_table'):
+        while reader_count:
+            batch = db_queue.get()
+            if batch is None:
+                reader_count -= 1
+            elif isinstance(batch, ImportCheckpoint):
+                # Files are only marked as imported by the swap, a refresh that
+                # dies part way leaves the live table untouched
+                if batch.completed:
+                    completed.append(batch)
+                start_time = time.perf_counter()
+                with telemetry.stage('copy'):
+                    conn.commit()
+                telemetry.commit(time.perf_counter() - start_time)
+            elif batch and not error:
+                try:
+                    with telemetry.stage('write'):
+                        batch = complete_rows(batch)
+                        cursor.executemany(insert, with_content_hash(batch) if upsert else batch)
+                        telemetry.count('rows_written', cursor.rowcount)
+                except Exception as e:
+                    # The readers are still drained, so none of them blocks on a full queue
+                    error = f"Error inserting data: {e}"
+            db_queue.task_done()
+
+    if error or failed or skipped:
+        conn.rollback()
+        drop_shadow_table(cursor)
+        conn.commit()
+        failed.append((None, f"{error + '. ' if error else ''}Full refresh aborted, the live table was left unchanged"))
+    else:
+        conn.commit()
+        start_time = time.perf_counter()
+        with telemetry.stage('swap'):
+            swap_shadow_table(conn, completed)
+        telemetry.commit(time.perf_counter() - start_time)
     cursor.close()
     conn.close()
 
-def validate_and_create_point(row, data_origin):  
+def validate_and_create_point(row, data_origin):
+    # Row-at-a-time reference for validate_batch, see the benchmark_validation command
     try:
-        poi_ratings_calc = [float(rating) for rating in row['poi_ratings'].strip('{}').split(',') if rating.strip()]
-
-        poi_id = int(row['poi_id'])
-        poi_name = row['poi_name']
-        poi_latitude = float(row['poi_latitude'])
-        poi_longitude = float(row['poi_longitude'])
-        poi_category = row['poi_category']
-        poi_ratings = row['poi_ratings']
-        poi_description = row.get('poi_description', "")
-        average_rating = sum(poi_ratings_calc) / len(poi_ratings_calc) if poi_ratings_calc else 0
-    
-        return (poi_id, poi_name, poi_latitude, poi_longitude, poi_category, poi_ratings, poi_description, data_origin, average_rating)
+        poi_ratings = row[POI_RATINGS]
+        poi_ratings_calc = parse_ratings(poi_ratings)
+
+        poi_id = int(row[POI_ID])
+        poi_name = row[POI_NAME]
+        poi_latitude = float(row[POI_LATITUDE])
+        poi_longitude = float(row[POI_LONGITUDE])
+        poi_category = row[POI_CATEGORY]
+        poi_description = row[POI_DESCRIPTION] if len(row) > POI_DESCRIPTION else ""
+        if not valid_coordinates(poi_latitude, poi_longitude) or not has_required_fields(poi_name, poi_category, poi_description):
+            return None
+
+        return (poi_id, poi_name, poi_latitude, poi_longitude, poi_category, poi_ratings, poi_description, data_origin) + rating_columns(poi_ratings_calc)
         
-    except (TypeError, ValueError) as e:
+    except (TypeError, ValueError, AttributeError, IndexError) as e:
         pass
\ No newline at end of file
@@ -0,0 +1,50 @@
+import os
+import hashlib
+from collections import namedtuple
+from datetime import datetime, timezone
+from geoDataImportApp.models import ImportManifest
+
+# Queued by the readers after a batch; the writer commits everything received so
+# far and records how far into the file that got, in the same transaction.
+ImportCheckpoint = namedtuple('ImportCheckpoint', ['file_path', 'offset', 'rows', 'completed'])
+
+
+def hash_file(file_path):
+    with open(file_path, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+def load_manifest(file_path, force=False):
+    # Returns the manifest row for this file, reset to the start when the content
+    # has changed since the last run (or when forced).
+    file_path = os.path.abspath(file_path)
+    file_size = os.path.getsize(file_path)
+    content_hash = hash_file(file_path)
+
+    manifest = ImportManifest.objects.filter(file_path=file_path).first()
+    if manifest and not force and manifest.file_size == file_size and manifest.content_hash == content_hash:
+        return manifest
+
+    manifest, _ = ImportManifest.objects.update_or_create(file_path=file_path, defaults={
+        'content_hash': content_hash,
+        'file_size': file_size,
+        'committed_offset': 0,
+        'committed_rows': 0,
+        'completed': False,
+    })
+    return manifest
+
+
+def save_checkpoint(cursor, checkpoint):
+    # Runs on the writer's raw sqlite3 connection, before its commit
+    cursor.execute(
+        "UPDATE geoDataImportApp_importmanifest "
+        "SET committed_offset = COALESCE(?, committed_offset), committed_rows = COALESCE(?, committed_rows), "
+        "completed = ?, updated_at = ? "
+        "WHERE file_path = ?",
+        (
+            checkpoint.offset, checkpoint.rows, checkpoint.completed,
+            datetime.now(timezone.utc).replace(tzinfo=None).isoformat(' '),
+            os.path.abspath(checkpoint.file_path),
+        )
+    )
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.2 on 2026-10-18 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoDataImportApp', '0004_pointsofinterest_average_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(max_length=1024, unique=True)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('file_size', models.BigIntegerField()),
+                ('committed_offset', models.BigIntegerField(default=0)),
+                ('committed_rows', models.BigIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoDataImportApp', '0005_importmanifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pointsofinterest',
+            name='content_hash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
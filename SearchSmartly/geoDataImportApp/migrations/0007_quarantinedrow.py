@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoDataImportApp', '0006_pointsofinterest_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuarantinedRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_file', models.CharField(max_length=1024)),
+                ('row_index', models.BigIntegerField()),
+                ('reason', models.CharField(max_length=100)),
+                ('row_data', models.TextField()),
+                ('rejected_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.0.2 on 2026-10-18 06:41
+
+import struct
+
+from django.db import migrations, models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    # Parses poi_ratings once for the rows imported before these columns existed,
+    # with the parsing and packing of ratings.py as they were at this migration
+    PointsOfInterest = apps.get_model('geoDataImportApp', 'PointsOfInterest')
+    table = PointsOfInterest._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT poi_id, poi_ratings FROM {table}")
+        updates = []
+        for poi_id, poi_ratings in cursor.fetchall():
+            try:
+                ratings = [float(rating) for rating in (poi_ratings or '').strip('{}').split(',') if rating.strip()]
+            except ValueError:
+                continue
+            updates.append((
+                len(ratings), sum(ratings), min(ratings, default=None), max(ratings, default=None),
+                struct.pack(f"<{len(ratings)}d", *ratings), poi_id,
+            ))
+        cursor.executemany(
+            f"UPDATE {table} SET rating_count = %s, rating_sum = %s, rating_min = %s, rating_max = %s, rating_values = %s WHERE poi_id = %s",
+            updates
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoDataImportApp', '0007_quarantinedrow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pointsofinterest',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pointsofinterest',
+            name='rating_max',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pointsofinterest',
+            name='rating_min',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pointsofinterest',
+            name='rating_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pointsofinterest',
+            name='rating_values',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
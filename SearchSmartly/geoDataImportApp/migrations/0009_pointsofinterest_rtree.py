@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 07:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoDataImportApp', '0008_pointsofinterest_rating_aggregates'),
+    ]
+
+    operations = [
+        # The SQL of spatial.py at this migration, which later changes to it must not alter
+        migrations.RunSQL(
+            [
+                'CREATE VIRTUAL TABLE IF NOT EXISTS "geoDataImportApp_pointsofinterest_rtree" '
+                'USING rtree(poi_id, min_latitude, max_latitude, min_longitude, max_longitude)',
+                'INSERT INTO "geoDataImportApp_pointsofinterest_rtree" (poi_id, min_latitude, max_latitude, min_longitude, max_longitude) '
+                'SELECT poi_id, poi_latitude, poi_latitude, poi_longitude, poi_longitude FROM geoDataImportApp_pointsofinterest',
+            ],
+            'DROP TABLE IF EXISTS "geoDataImportApp_pointsofinterest_rtree"',
+        ),
+    ]
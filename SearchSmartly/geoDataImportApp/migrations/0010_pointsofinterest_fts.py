@@ -0,0 +1,22 @@
+# Generated by Django 5.0.2 on 2026-10-18 07:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoDataImportApp', '0009_pointsofinterest_rtree'),
+    ]
+
+    operations = [
+        # The SQL of search.py at this migration, which later changes to it must not alter
+        migrations.RunSQL(
+            [
+                'CREATE VIRTUAL TABLE IF NOT EXISTS "geoDataImportApp_pointsofinterest_fts" USING fts5(poi_name, poi_description, '
+                "content='geoDataImportApp_pointsofinterest', content_rowid='poi_id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+                'INSERT INTO "geoDataImportApp_pointsofinterest_fts" ("geoDataImportApp_pointsofinterest_fts") VALUES (\'rebuild\')',
+            ],
+            'DROP TABLE IF EXISTS "geoDataImportApp_pointsofinterest_fts"',
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoDataImportApp', '0010_pointsofinterest_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pointsofinterest',
+            index=models.Index(fields=['poi_category'], name='poi_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pointsofinterest',
+            index=models.Index(fields=['average_rating'], name='poi_average_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.2 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+
+def create_generation_row(apps, schema_editor):
+    # The writers only ever UPDATE this row, so it has to exist from the start
+    DatasetGeneration = apps.get_model('geoDataImportApp', 'DatasetGeneration')
+    DatasetGeneration.objects.get_or_create(id=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoDataImportApp', '0011_pointsofinterest_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_generation_row, migrations.RunPython.noop),
+    ]
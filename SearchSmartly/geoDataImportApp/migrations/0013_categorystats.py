@@ -0,0 +1,44 @@
+# Generated by Django 5.0.2 on 2026-10-18 07:30
+
+from django.db import migrations, models
+
+# stats.rebuild_category_stats() as it was at this migration, which later changes to it must not alter
+ROUNDED_RATING = 'MIN(5, MAX(1, CAST(p.average_rating + 0.5 AS INTEGER)))'
+FILL_CATEGORY_STATS_SQL = (
+    'INSERT INTO "geoDataImportApp_categorystats" (poi_category, poi_count, rated_count, rating_count, rating_sum, '
+    'rated_1, rated_2, rated_3, rated_4, rated_5, min_latitude, max_latitude, min_longitude, max_longitude) '
+    'SELECT p.poi_category, COUNT(*), SUM(p.rating_count > 0), SUM(p.rating_count), SUM(p.rating_sum), '
+    + ''.join(f'SUM(p.rating_count > 0 AND {ROUNDED_RATING} = {stars}), ' for stars in range(1, 6))
+    + 'MIN(p.poi_latitude), MAX(p.poi_latitude), MIN(p.poi_longitude), MAX(p.poi_longitude) '
+    'FROM geoDataImportApp_pointsofinterest p GROUP BY p.poi_category'
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoDataImportApp', '0012_datasetgeneration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('poi_category', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('poi_count', models.IntegerField(default=0)),
+                ('rated_count', models.IntegerField(default=0)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('rating_sum', models.FloatField(default=0)),
+                ('rated_1', models.IntegerField(default=0)),
+                ('rated_2', models.IntegerField(default=0)),
+                ('rated_3', models.IntegerField(default=0)),
+                ('rated_4', models.IntegerField(default=0)),
+                ('rated_5', models.IntegerField(default=0)),
+                ('min_latitude', models.FloatField(blank=True, null=True)),
+                ('max_latitude', models.FloatField(blank=True, null=True)),
+                ('min_longitude', models.FloatField(blank=True, null=True)),
+                ('max_longitude', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunSQL(FILL_CATEGORY_STATS_SQL, migrations.RunSQL.noop),
+    ]
@@ -1,6 +1,127 @@
 from enum import unique
 from unittest.util import _MAX_LENGTH
-from django.db import models
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.expressions import Func, RawSQL
+from django.db.models.functions import Coalesce
+from geoDataImportApp.querycache import bump_generation, cached_query
+from geoDataImportApp.ratings import pack_ratings
+from geoDataImportApp.search import FTS_MATCH_SQL, POI_FTS_TABLE, index_text, match_expression, unindex_text, unindex_texts
+from geoDataImportApp.spatial import RTREE_BBOX_SQL, find_nearest, index_point, unindex_point, unindex_points
+from geoDataImportApp.stats import refresh_category_stats
+
+# Ids a bulk delete() takes out, pinned before it changes the indexes that
+# search() and within_bbox() filter on
+POI_DELETED_TABLE = 'geoDataImportApp_pointsofinterest_deleted'
+
+class BlobConcat(Func):
+    # SQLite's || returns TEXT, cast back so the packed ratings stay a BLOB
+    arg_joiner = ' || '
+    template = 'CAST(%(expressions)s AS BLOB)'
+    output_field = models.BinaryField()
+
+class SearchRank(Func):
+    # bm25 rank of a PoI for an FTS5 match expression: SearchRank(Value(expression), 'poi_id').
+    # The matches are materialised once per query and looked up by rowid, a
+    # MATCH per row would run the whole full-text query again for every row.
+    arg_joiner = ') SELECT rank FROM fts_match WHERE fts_match.rowid = '
+    template = (
+        f'(WITH fts_match AS MATERIALIZED (SELECT rowid, rank FROM "{POI_FTS_TABLE}" '
+        f'WHERE "{POI_FTS_TABLE}" MATCH %(expressions)s)'
+    )
+    output_field = models.FloatField()
+
+class PointsOfInterestQuerySet(models.QuerySet):
+    def within_bbox(self, south, west, north, east):
+        # PoIs inside a map viewport, found through the R*Tree instead of a full
+        # scan. A box with west > east crosses the antimeridian.
+        if west > east:
+            return self.within_bbox(south, west, north, 180) | self.within_bbox(south, -180, north, east)
+        return self.filter(
+            Q(poi_id__in=RawSQL(RTREE_BBOX_SQL, (south, north, west, east))),
+            poi_latitude__gte=south, poi_latitude__lte=north,
+            poi_longitude__gte=west, poi_longitude__lte=east,
+        )
+
+    def nearest(self, latitude, longitude, k, radius=None, fields=('poi_id',), fetch=list):
+        # [(values of fields, distance in metres)] of the k closest PoIs
+        return find_nearest(self, latitude, longitude, k, radius, fields, fetch)
+
+    def search(self, query):
+        # Full-text search on names and descriptions through the FTS5 index, best
+        # match (lowest bm25 rank) first. Every word must match, as a prefix.
+        expression = match_expression(query)
+        if not expression:
+            return self.none()
+        return self.filter(poi_id__in=RawSQL(FTS_MATCH_SQL, (expression,))).annotate(
+            search_rank=SearchRank(Value(expression), 'poi_id')
+        ).order_by('search_rank')
+
+    def categories(self):
+        # Every distinct category in order, found with one seek into
+        # poi_category_idx per category rather than a scan of all rows. Filters
+        # on the queryset are not applied.
+        table = self.model._meta.db_table
+
+        def find_categories():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'WITH RECURSIVE category(name) AS ('
+                    f'SELECT MIN(poi_category) FROM "{table}" UNION ALL '
+                    f'SELECT (SELECT MIN(poi_category) FROM "{table}" WHERE poi_category > name) FROM category WHERE name IS NOT NULL'
+                    f') SELECT name FROM category WHERE name IS NOT NULL'
+                )
+                return [name for name, in cursor.fetchall()]
+        return cached_query('categories', table, find_categories)
+
+    def delete(self):
+        # Bulk deletes (the admin's "Delete selected") take the rows out of the
+        # R*Tree, the full-text index and the category stats in one statement
+        # each, in the same transaction as the rows, by the ids pinned up front
+        try:
+            poi_ids_sql, params = self.values('poi_id').query.sql_with_params()
+        except EmptyResultSet:
+            return super().delete()
+        with transaction.atomic(), connection.cursor() as cursor:
+            categories = list(self.values_list('poi_category', flat=True).distinct())
+            cursor.execute(f'CREATE TEMP TABLE IF NOT EXISTS "{POI_DELETED_TABLE}" (poi_id INTEGER PRIMARY KEY)')
+            cursor.execute(f'INSERT OR IGNORE INTO "{POI_DELETED_TABLE}" {poi_ids_sql}', params)
+            deleted_sql = f'SELECT poi_id FROM "{POI_DELETED_TABLE}"'
+            unindex_texts(cursor, deleted_sql, ())
+            unindex_points(cursor, deleted_sql, ())
+            result = models.QuerySet.delete(self.model.objects.filter(poi_id__in=RawSQL(deleted_sql, ())))
+            cursor.execute(f'DELETE FROM "{POI_DELETED_TABLE}"')
+            refresh_category_stats(cursor, categories)
+            bump_generation(cursor)
+        return result
+
+    def append_ratings(self, ratings):
+        # Adds ratings to every PoI in the queryset with a single UPDATE: the
+        # aggregates and average are adjusted from their stored values, the packed
+        # ratings and the raw text are appended to, nothing is parsed again
+        ratings = [float(rating) for rating in ratings]
+        if not ratings:
+            return 0
+        count, total = len(ratings), sum(ratings)
+        lowest, highest = min(ratings), max(ratings)
+        with transaction.atomic(), connection.cursor() as cursor:
+            categories = list(self.values_list('poi_category', flat=True).distinct())
+            updated = self.update(
+                rating_count=F('rating_count') + count,
+                rating_sum=F('rating_sum') + total,
+                rating_min=Func(Coalesce('rating_min', Value(lowest)), Value(lowest), function='MIN'),
+                rating_max=Func(Coalesce('rating_max', Value(highest)), Value(highest), function='MAX'),
+                average_rating=(F('rating_sum') + total) / (F('rating_count') + count),
+                rating_values=BlobConcat(Coalesce('rating_values', Value(b'')), Value(pack_ratings(ratings))),
+                poi_ratings=RawSQL(
+                    "'{' || CASE WHEN TRIM(poi_ratings, '{}') = '' THEN '' ELSE TRIM(poi_ratings, '{}') || ',' END || %s || '}'",
+                    (','.join(map(str, ratings)),)
+                ),
+            )
+            refresh_category_stats(cursor, categories)
+            bump_generation(cursor)
+        return updated
 
 class PointsOfInterest(models.Model):
     poi_id = models.IntegerField(unique=True, primary_key=True)
@@ -11,4 +132,83 @@ class PointsOfInterest(models.Model):
     poi_ratings = models.TextField()
     poi_description = models.TextField()
     data_origin = models.CharField(max_length=5)
-    average_rating = models.FloatField(default=0)
\ No newline at end of file
+    average_rating = models.FloatField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.FloatField(default=0)
+    rating_min = models.FloatField(null=True, blank=True)
+    rating_max = models.FloatField(null=True, blank=True)
+    rating_values = models.BinaryField(default=b'', blank=True)
+    content_hash = models.BigIntegerField(null=True, blank=True)
+
+    objects = PointsOfInterestQuerySet.as_manager()
+
+    class Meta:
+        # The admin filters on poi_category and sorts on average_rating
+        indexes = [
+            models.Index(fields=['poi_category'], name='poi_category_idx'),
+            models.Index(fields=['average_rating'], name='poi_average_rating_idx'),
+        ]
+
+    # The importers index their rows in bulk, single saves (e.g. from the admin)
+    # keep the R*Tree, the full-text index and the category stats in step here,
+    # bulk deletes in PointsOfInterestQuerySet.delete(). Queryset updates don't.
+    def save(self, *args, **kwargs):
+        with transaction.atomic(), connection.cursor() as cursor:
+            categories = [self.poi_category, *type(self).objects.filter(pk=self.pk).values_list('poi_category', flat=True)]
+            unindex_text(cursor, self.poi_id)
+            super().save(*args, **kwargs)
+            index_point(cursor, self.poi_id, self.poi_latitude, self.poi_longitude)
+            index_text(cursor, self.poi_id)
+            refresh_category_stats(cursor, categories)
+            bump_generation(cursor)
+
+    def delete(self, *args, **kwargs):
+        poi_id = self.poi_id
+        with transaction.atomic(), connection.cursor() as cursor:
+            unindex_text(cursor, poi_id)
+            result = super().delete(*args, **kwargs)
+            unindex_point(cursor, poi_id)
+            refresh_category_stats(cursor, [self.poi_category])
+            bump_generation(cursor)
+        return result
+
+class CategoryStats(models.Model):
+    # Aggregates of every poi_category, kept up to date by the writers, see stats.py
+    poi_category = models.CharField(max_length=50, primary_key=True)
+    poi_count = models.IntegerField(default=0)
+    rated_count = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.FloatField(default=0)
+    rated_1 = models.IntegerField(default=0)
+    rated_2 = models.IntegerField(default=0)
+    rated_3 = models.IntegerField(default=0)
+    rated_4 = models.IntegerField(default=0)
+    rated_5 = models.IntegerField(default=0)
+    min_latitude = models.FloatField(null=True, blank=True)
+    max_latitude = models.FloatField(null=True, blank=True)
+    min_longitude = models.FloatField(null=True, blank=True)
+    max_longitude = models.FloatField(null=True, blank=True)
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+class DatasetGeneration(models.Model):
+    # A single row, bumped by every write to the PoIs, see querycache.py
+    generation = models.BigIntegerField(default=0)
+
+class ImportManifest(models.Model):
+    file_path = models.CharField(max_length=1024, unique=True)
+    content_hash = models.CharField(max_length=64)
+    file_size = models.BigIntegerField()
+    committed_offset = models.BigIntegerField(default=0)
+    committed_rows = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class QuarantinedRow(models.Model):
+    source_file = models.CharField(max_length=1024)
+    row_index = models.BigIntegerField()
+    reason = models.CharField(max_length=100)
+    row_data = models.TextField()
+    rejected_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,127 @@
+import sys
+import time
+import argparse
+import threading
+from queue import Queue
+
+DEFAULT_QUEUE_DEPTH = 8
+# Files the fast and lightning importers read at the same time
+DEFAULT_FILE_WORKERS = 4
+SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+SIZE_SAMPLE_ROWS = 16
+
+
+def parse_size(value):
+    # argparse type for sizes such as 512M, 2G or a plain number of bytes
+    number, unit = value.strip(), ''
+    if number and number[-1].upper() in SIZE_UNITS:
+        number, unit = number[:-1], number[-1].upper()
+    try:
+        size = int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size: '{value}'")
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"Size must be positive: '{value}'")
+    return size
+
+
+def estimate_size(batch):
+    # Rough in-memory size of a queued batch (list of records, tuples, dicts or
+    # model instances), extrapolated from a sample of its rows. Markers count as 0.
+    if not isinstance(batch, list) or not batch:
+        return 0
+    sample = batch[::max(1, len(batch) // SIZE_SAMPLE_ROWS)]
+    sample_size = 0
+    for row in sample:
+        if isinstance(row, (tuple, list)):
+            values = row
+        else:
+            if not isinstance(row, dict):
+                sample_size += sys.getsizeof(row)
+                row = row.__dict__
+            values = row.values()
+        sample_size += sys.getsizeof(row) + sum(map(sys.getsizeof, values))
+    return sys.getsizeof(batch) + sample_size * len(batch) // len(sample)
+
+
+class RowBatch(list):
+    # Raw rows on their way to validation, remembering the file they came from
+    # and the row index of the first one, for the quarantine
+
+    def __init__(self, rows, file_path, first_index):
+        super().__init__(rows)
+        self.file_path = file_path
+        self.first_index = first_index
+
+
+class MemoryBudget:
+    # Shared by every queue of an import, blocks producers while the batches
+    # queued across the whole pipeline would exceed the limit
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def reserve(self, size, queue):
+        with self.condition:
+            # A queue whose consumer is starving always accepts one batch, so a
+            # stage can never wait on memory held by the stage waiting on it
+            while size and self.used and self.used + size > self.limit and not queue.empty():
+                self.condition.wait(0.1)
+            self.used += size
+
+    def release(self, size):
+        if size:
+            with self.condition:
+                self.used -= size
+                self.condition.notify_all()
+
+
+class PipelineQueue(Queue):
+    # Bounded queue between two import stages that records how long producers
+    # were blocked on it (backpressure) and consumers waited on it (starvation)
+
+    def __init__(self, name, maxsize=DEFAULT_QUEUE_DEPTH, budget=None):
+        super().__init__(maxsize)
+        self.name = name
+        self.budget = budget
+        self.put_stall = 0
+        self.get_stall = 0
+
+    def put(self, item, block=True, timeout=None):
+        size = estimate_size(item) if self.budget else 0
+        start_time = time.perf_counter()
+        if self.budget:
+            self.budget.reserve(size, self)
+        super().put((size, item), block, timeout)
+        stall = time.perf_counter() - start_time
+        with self.mutex:
+            self.put_stall += stall
+
+    def get(self, block=True, timeout=None):
+        start_time = time.perf_counter()
+        size, item = super().get(block, timeout)
+        stall = time.perf_counter() - start_time
+        with self.mutex:
+            self.get_stall += stall
+        if self.budget:
+            self.budget.release(size)
+        return item
+
+
+def queue_stalls(queues):
+    # Producer and consumer stall time per stage boundary, queues sharing a name are added up
+    stalls = {}
+    for queue in queues:
+        stall = stalls.setdefault(queue.name, {'producers_blocked': 0, 'consumers_waiting': 0})
+        stall['producers_blocked'] += queue.put_stall
+        stall['consumers_waiting'] += queue.get_stall
+    return stalls
+
+
+def report_stalls(queues):
+    return [
+        f"Stall {name}: producers blocked {stall['producers_blocked']:.2f}s, consumers waiting {stall['consumers_waiting']:.2f}s"
+        for name, stall in queue_stalls(queues).items()
+    ]
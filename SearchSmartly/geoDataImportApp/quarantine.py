@@ -0,0 +1,127 @@
+import os
+import argparse
+import csv
+import json
+import sqlite3
+import threading
+from queue import Queue
+from datetime import datetime, timezone
+from django.conf import settings
+
+QUARANTINE_TABLE = 'geoDataImportApp_quarantinedrow'
+QUARANTINE_BATCH_SIZE = 10000
+QUARANTINE_FIELDS = ['source_file', 'row_index', 'reason', 'row_data']
+
+
+class Quarantine:
+    # Collects rejected rows (source file, row index, reason and the raw row)
+    # and hands them to a background thread in batches, which appends them to
+    # a CSV or NDJSON file or to the QuarantinedRow table. Without a target
+    # rejected rows are only counted by the telemetry.
+
+    def __init__(self, target=None, batch_size=QUARANTINE_BATCH_SIZE):
+        self.target = target
+        self.batch_size = batch_size
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.count = 0
+        if target:
+            self.queue = Queue()
+            self.writer = threading.Thread(target=self.write_batches)
+            self.writer.start()
+
+    def add(self, source_file, rejections):
+        # rejections are (row_index, reason, row) tuples
+        if not self.target or not rejections:
+            return
+        source_file = os.path.abspath(source_file)
+        with self.lock:
+            self.buffer.extend((source_file, row_index, reason, row) for row_index, reason, row in rejections)
+            self.count += len(rejections)
+            if len(self.buffer) >= self.batch_size:
+                self.queue.put(self.buffer)
+                self.buffer = []
+
+    def close(self):
+        if not self.target:
+            return
+        with self.lock:
+            if self.buffer:
+                self.queue.put(self.buffer)
+                self.buffer = []
+        self.queue.put(None)
+        self.writer.join()
+
+    def write_batches(self):
+        if self.target == 'table':
+            write = self.write_table()
+        elif self.target.split('.')[-1].lower() in ('ndjson', 'jsonl'):
+            write = self.write_ndjson()
+        else:
+            write = self.write_csv()
+        next(write)
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                write.close()
+                break
+            write.send(batch)
+
+    def write_csv(self):
+        new_file = not os.path.exists(self.target) or not os.path.getsize(self.target)
+        with open(self.target, 'a', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            if new_file:
+                writer.writerow(QUARANTINE_FIELDS)
+            while True:
+                batch = yield
+                writer.writerows(
+                    (source_file, row_index, reason, json.dumps(row, default=str))
+                    for source_file, row_index, reason, row in batch
+                )
+                file.flush()
+
+    def write_ndjson(self):
+        with open(self.target, 'a', encoding='utf-8') as file:
+            while True:
+                batch = yield
+                file.writelines(
+                    json.dumps(dict(zip(QUARANTINE_FIELDS, rejection)), default=str) + '\n'
+                    for rejection in batch
+                )
+                file.flush()
+
+    def write_table(self):
+        conn = sqlite3.connect(settings.DATABASES['default']['NAME'], timeout=30)
+        try:
+            while True:
+                batch = yield
+                rejected_at = datetime.now(timezone.utc).replace(tzinfo=None).isoformat(' ')
+                conn.executemany(
+                    f"INSERT INTO {QUARANTINE_TABLE} (source_file, row_index, reason, row_data, rejected_at) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (source_file, row_index, reason, json.dumps(row, default=str), rejected_at)
+                        for source_file, row_index, reason, row in batch
+                    ]
+                )
+                conn.commit()
+        finally:
+            conn.close()
+
+
+def parse_quarantine_target(value):
+    # argparse type: 'table' or a .csv/.ndjson/.jsonl path
+    if value != 'table' and value.split('.')[-1].lower() not in ('csv', 'ndjson', 'jsonl'):
+        raise argparse.ArgumentTypeError(f"Quarantine target must be 'table' or a .csv/.ndjson file: '{value}'")
+    return value
+
+
+def report_rejections(telemetry, quarantine):
+    # One summary line instead of a line per rejected row
+    if not telemetry.rejected:
+        return []
+    reasons = ', '.join(f"{reason}: {count}" for reason, count in telemetry.rejected.most_common())
+    lines = [f"Rejected {sum(telemetry.rejected.values())} rows ({reasons})"]
+    if quarantine.target:
+        lines.append(f"Rejected rows written to {quarantine.target}")
+    return lines
@@ -0,0 +1,35 @@
+import hashlib
+from django.core.cache import cache
+from django.db import connection
+
+# The imported data only changes when something writes PoIs, so query results
+# are cached under the dataset generation: a counter every writer bumps in the
+# same transaction as its rows. A new generation means new cache keys, and the
+# entries of older ones age out of the LRU cache on their own.
+GENERATION_TABLE = 'geoDataImportApp_datasetgeneration'
+BUMP_GENERATION_SQL = f'UPDATE "{GENERATION_TABLE}" SET generation = generation + 1 WHERE id = 1'
+
+
+def bump_generation(cursor):
+    # Works on the importers' raw sqlite3 cursors as well as Django's
+    cursor.execute(BUMP_GENERATION_SQL)
+
+
+def current_generation(cursor=None):
+    # Read on Django's connection, or on the given one (the async views' pool)
+    if cursor is None:
+        with connection.cursor() as cursor:
+            return current_generation(cursor)
+    cursor.execute(f'SELECT generation FROM "{GENERATION_TABLE}" WHERE id = 1')
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def cached_query(name, params, compute, timeout=None, cursor=None):
+    # compute() once per generation and params. The generation is read first,
+    # so a result can only ever be stored under a generation older than its data.
+    digest = hashlib.md5(repr(params).encode('utf-8')).hexdigest()
+    key = f'poi-query:{name}:{current_generation(cursor)}:{digest}'
+    if timeout is None:
+        return cache.get_or_set(key, compute)
+    return cache.get_or_set(key, compute, timeout)
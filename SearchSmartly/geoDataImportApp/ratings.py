@@ -0,0 +1,29 @@
+import struct
+
+# Ratings are stored as packed little-endian doubles in rating_values next to
+# their count, sum, min and max, so rating queries never parse poi_ratings and
+# new ratings can be appended to the blob without reading it back.
+RATING_FORMAT = '<d'
+RATING_SIZE = struct.calcsize(RATING_FORMAT)
+
+
+def pack_ratings(ratings):
+    return struct.pack(f"<{len(ratings)}d", *ratings)
+
+
+def unpack_ratings(packed):
+    return [rating for rating, in struct.iter_unpack(RATING_FORMAT, packed or b'')]
+
+
+def rating_columns(ratings):
+    # (average_rating, rating_count, rating_sum, rating_min, rating_max, rating_values)
+    # for a list of floats, in insert column order
+    if not ratings:
+        return (0, 0, 0, None, None, b'')
+    total = sum(ratings)
+    return (total / len(ratings), len(ratings), total, min(ratings), max(ratings), pack_ratings(ratings))
+
+
+def parse_ratings(poi_ratings):
+    # '{3.0,4.5}' -> [3.0, 4.5], raises ValueError on anything that isn't a number
+    return [float(rating) for rating in poi_ratings.strip('{}').split(',') if rating.strip()]
@@ -0,0 +1,330 @@
+import io
+import os
+import bz2
+import glob
+import gzip
+import json
+import lzma
+import threading
+import xml.etree.ElementTree as ET
+from queue import Full, Queue
+
+# Maps every accepted file extension to the reader that handles it.
+# NDJSON / JSON Lines go through the same JSON reader as plain arrays.
+FILE_FORMATS = {
+    'csv': 'csv',
+    'json': 'json',
+    'ndjson': 'json',
+    'jsonl': 'json',
+    'xml': 'xml',
+}
+
+# Compressed input is recognised by its last suffix (pois.csv.gz) or, failing
+# that, by its magic bytes, and decompressed on the fly.
+COMPRESSION_SUFFIXES = {
+    'gz': 'gzip',
+    'gzip': 'gzip',
+    'bz2': 'bz2',
+    'xz': 'xz',
+}
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+]
+COMPRESSION_OPENERS = {
+    'gzip': lambda file: gzip.GzipFile(fileobj=file),
+    'bz2': bz2.BZ2File,
+    'xz': lzma.LZMAFile,
+}
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+DECOMPRESS_QUEUE_DEPTH = 8
+
+# Every reader hands out records as plain sequences in this order (the CSV's
+# column order), whatever the source format. CSV rows stop after the ratings,
+# a missing description counts as "".
+RECORD_FIELDS = ('poi_id', 'poi_name', 'poi_category', 'poi_latitude', 'poi_longitude', 'poi_ratings', 'poi_description')
+POI_ID, POI_NAME, POI_CATEGORY, POI_LATITUDE, POI_LONGITUDE, POI_RATINGS, POI_DESCRIPTION = range(len(RECORD_FIELDS))
+
+JSON_CHUNK_SIZE = 1024 * 1024
+JSON_WHITESPACE = ' \t\n\r'
+
+XML_RECORD_TAG = 'DATA_RECORD'
+XML_FIELDS = {
+    'pid': POI_ID,
+    'pname': POI_NAME,
+    'platitude': POI_LATITUDE,
+    'plongitude': POI_LONGITUDE,
+    'pcategory': POI_CATEGORY,
+    'pratings': POI_RATINGS,
+    'poi_description': POI_DESCRIPTION,
+}
+
+
+def split_compression(file_path):
+    # 'pois.csv.gz' -> ('pois.csv', 'gzip'), 'pois.csv' -> ('pois.csv', None)
+    base, _, suffix = file_path.rpartition('.')
+    compression = COMPRESSION_SUFFIXES.get(suffix.lower())
+    if base and compression:
+        return base, compression
+    return file_path, None
+
+
+def get_file_format(file_path):
+    return FILE_FORMATS.get(split_compression(file_path)[0].split('.')[-1].lower())
+
+
+def get_compression(file_path):
+    compression = split_compression(file_path)[1]
+    if compression:
+        return compression
+    with open(file_path, 'rb') as file:
+        head = file.read(6)
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def find_import_files(paths):
+    # Expands files, directories (searched recursively) and glob patterns into
+    # the files to import, largest first so the longest imports start early.
+    # Returns the files and a message for every argument that had to be skipped;
+    # unsupported files found inside a directory or glob are left out quietly.
+    files = {}
+    skipped = []
+    for path in paths:
+        if os.path.isdir(path):
+            # Dangling symlinks and the like aren't files
+            matches = sorted(
+                match for match in (os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+                if os.path.isfile(match)
+            )
+        elif glob.has_magic(path):
+            matches = sorted(match for match in glob.glob(path, recursive=True) if os.path.isfile(match))
+            if not matches:
+                skipped.append(f"No files match '{path}'. Skipping...")
+        elif not os.path.exists(path):
+            skipped.append(f"File '{path}' does not exist. Skipping...")
+            continue
+        elif get_file_format(path) is None:
+            skipped.append(f"Unsupported file type: '{path.split('.')[-1]}'. Skipping...")
+            continue
+        else:
+            matches = [path]
+        for match in matches:
+            file_format = get_file_format(match)
+            if file_format and os.path.abspath(match) not in files:
+                files[os.path.abspath(match)] = (match, file_format)
+
+    sizes = {}
+    for file_path, file_format in files.values():
+        try:
+            sizes[file_path, file_format] = os.path.getsize(file_path)
+        except OSError as e:
+            # Removed or made unreadable since it was found
+            skipped.append(f"File '{file_path}' could not be read: {e.strerror}. Skipping...")
+    files = sorted(sizes, key=sizes.get, reverse=True)
+    return files, skipped
+
+
+def seek_forward(file, offset):
+    # Seeks, or reads and discards on streams that can't seek (compressed input)
+    if file.seekable():
+        file.seek(offset)
+        return
+    while offset > 0:
+        chunk = file.read(min(offset, DECOMPRESS_CHUNK_SIZE))
+        if not chunk:
+            break
+        offset -= len(chunk)
+
+
+class DecompressingReader(io.RawIOBase):
+    # Raw stream of decompressed bytes. Decompression runs in its own thread,
+    # a few chunks ahead of the reader; zlib, bz2 and lzma release the GIL
+    # while they work, so it overlaps with parsing.
+
+    def __init__(self, source, compression, telemetry=None):
+        self.decompressed = COMPRESSION_OPENERS[compression](source)
+        self.source = source
+        self.telemetry = telemetry
+        self.chunks = Queue(DECOMPRESS_QUEUE_DEPTH)
+        self.pending = memoryview(b'')
+        self.finished = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.decompress, daemon=True)
+        self.thread.start()
+
+    def readable(self):
+        return True
+
+    def decompress(self):
+        try:
+            while True:
+                if self.telemetry:
+                    with self.telemetry.stage('decompress'):
+                        chunk = self.decompressed.read(DECOMPRESS_CHUNK_SIZE)
+                else:
+                    chunk = self.decompressed.read(DECOMPRESS_CHUNK_SIZE)
+                if not self.put(chunk) or not chunk:
+                    return
+        except Exception as e:
+            self.put(e)
+
+    def put(self, chunk):
+        # Gives up once the reader has closed the stream
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(chunk, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def readinto(self, buffer):
+        if not self.pending:
+            if self.finished:
+                return 0
+            chunk = self.chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                self.finished = True
+                return 0
+            self.pending = memoryview(chunk)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+            self.thread.join()
+            self.decompressed.close()
+            self.source.close()
+        super().close()
+
+
+def record_description(record):
+    return record[POI_DESCRIPTION] if len(record) > POI_DESCRIPTION else ""
+
+
+def record_as_dict(record):
+    # Named fields for the few places that want them, e.g. quarantined rows
+    return dict(zip(RECORD_FIELDS, record))
+
+
+def json_record(item):
+    coordinates = item.get('coordinates') or {}
+    return (
+        item.get('id'),
+        item.get('name'),
+        item.get('category'),
+        coordinates.get('latitude'),
+        coordinates.get('longitude'),
+        ','.join(map(str, item.get('ratings', []))),
+        item.get('description', ""),
+    )
+
+
+def iter_json_records(file, chunk_size=JSON_CHUNK_SIZE):
+    # Yields one POI object at a time from either a top-level JSON array or
+    # NDJSON, so only the current chunk of the file is ever held in memory.
+    buffer = file.read(chunk_size)
+    stripped = buffer.lstrip(JSON_WHITESPACE)
+    while not stripped and buffer:
+        buffer = file.read(chunk_size)
+        stripped = buffer.lstrip(JSON_WHITESPACE)
+
+    if stripped.startswith('['):
+        yield from _iter_json_array(file, stripped[1:], chunk_size)
+    else:
+        yield from _iter_json_lines(file, buffer, chunk_size)
+
+
+def _iter_json_array(file, buffer, chunk_size):
+    decoder = json.JSONDecoder()
+    pos = 0
+    eof = False
+    expect_value = True
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in JSON_WHITESPACE:
+            pos += 1
+
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            buffer = file.read(chunk_size)
+            pos = 0
+            eof = not buffer
+            continue
+
+        char = buffer[pos]
+        if char == ']':
+            return
+        if not expect_value:
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
+            pos += 1
+            expect_value = True
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            end = None
+
+        # A value that runs up to the end of the buffer may continue in the
+        # next chunk, so only trust it once more data (or EOF) has been seen.
+        if end is None or (end == len(buffer) and not eof):
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        yield item
+        pos = end
+        expect_value = False
+
+
+def _iter_json_lines(file, buffer, chunk_size):
+    while True:
+        chunk = file.read(chunk_size)
+        lines = (buffer + chunk).split('\n')
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+        if not chunk:
+            break
+
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+def iter_xml_records(source):
+    # Handles each DATA_RECORD as soon as its closing tag is parsed and then
+    # releases it, so the document tree never grows past a single record.
+    context = ET.iterparse(source, events=('start', 'end'))
+    _, root = next(context)
+
+    for event, element in context:
+        if event != 'end' or element.tag != XML_RECORD_TAG:
+            continue
+
+        record = [None, None, None, None, None, None, ""]
+        for child in element:
+            field = XML_FIELDS.get(child.tag)
+            # An empty element has no text, which leaves the field's default ("" for the description)
+            if field is not None and child.text is not None:
+                record[field] = child.text
+        yield record
+
+        element.clear()
+        root.clear()
@@ -0,0 +1,61 @@
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db.backends.sqlite3.base import FORMAT_QMARK_REGEX
+
+# The async geo views run their queries on a fixed set of threads, each with
+# its own read-only SQLite connection that is opened once and kept. Requests
+# beyond READ_POOL_SIZE wait in the executor's queue, not in a thread of their
+# own, and sqlite3 lets go of the GIL while a query runs, so the event loop
+# keeps accepting requests. WAL readers don't block the importers' writer.
+READ_POOL_SIZE = 8
+READ_EXECUTOR = ThreadPoolExecutor(max_workers=READ_POOL_SIZE, thread_name_prefix='geo-read')
+read_state = threading.local()
+
+
+def read_connection():
+    # This pool thread's connection, opened on first use
+    if not hasattr(read_state, 'connection'):
+        path = Path(settings.DATABASES['default']['NAME']).resolve()
+        connection = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True)
+        connection.execute("PRAGMA query_only = ON")
+        connection.execute("PRAGMA cache_size = -65536")
+        connection.execute("PRAGMA mmap_size = 268435456")
+        read_state.connection = connection
+    return read_state.connection
+
+
+async def run_read(function, *args):
+    # Runs function(*args) on a pool thread, where read_query() and friends
+    # read through that thread's connection
+    return await asyncio.get_running_loop().run_in_executor(READ_EXECUTOR, partial(function, *args))
+
+
+def read_query(queryset):
+    # Column names and rows of a values() or values_list() queryset, compiled by
+    # the ORM and read on the pool connection. Extra selects come first, where
+    # the compiler puts them.
+    query = queryset.query
+    try:
+        sql, params = query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return [], []
+    columns = [*query.extra_select, *query.values_select, *query.annotation_select]
+    rows = read_connection().execute(FORMAT_QMARK_REGEX.sub('?', sql).replace('%%', '%'), params).fetchall()
+    return columns, rows
+
+
+def read_rows(queryset):
+    # Like list(queryset) for a values_list() queryset without extra selects
+    return read_query(queryset)[1]
+
+
+def read_values(queryset):
+    # Like list(queryset) for a values() queryset
+    columns, rows = read_query(queryset)
+    return [dict(zip(columns, row)) for row in rows]
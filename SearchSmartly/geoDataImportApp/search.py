@@ -0,0 +1,75 @@
+import re
+from geoDataImportApp.upsert import POI_TABLE, POI_TEMP_TABLE
+
+# External-content FTS5 index over names and descriptions: it keeps only the
+# inverted index and reads the text from the main table, so it has to be told
+# the old text of every row that changes. Prefixes of 2 and 3 characters get
+# their own index entries, which keeps search-as-you-type queries cheap.
+POI_FTS_TABLE = 'geoDataImportApp_pointsofinterest_fts'
+FTS_COLUMNS = 'poi_name, poi_description'
+
+CREATE_FTS_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS "{POI_FTS_TABLE}" USING fts5({FTS_COLUMNS}, '
+    f"content='{POI_TABLE}', content_rowid='poi_id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+FTS_MATCH_SQL = f'SELECT rowid FROM "{POI_FTS_TABLE}" WHERE "{POI_FTS_TABLE}" MATCH %s'
+
+SEARCH_TOKEN = re.compile(r'\w+')
+
+
+def match_expression(query):
+    # 'caf bar' -> '"caf"* "bar"*': every word of the query has to appear, as a
+    # word or the start of one. Quoting keeps FTS5 syntax out of user input.
+    return ' '.join(f'"{token}"*' for token in SEARCH_TOKEN.findall(query))
+
+
+def index_staged_text_sql(upsert=False):
+    # Like unindex_staged_points_sql(), runs before the staged rows are copied:
+    # rows whose text is about to change are taken out of the index with their
+    # current text, then new and changed rows are added with the staged text.
+    changed = 'p.poi_name IS NOT t.poi_name OR p.poi_description IS NOT t.poi_description'
+    statements = [
+        f'INSERT INTO "{POI_FTS_TABLE}" (rowid, {FTS_COLUMNS}) '
+        f'SELECT t.poi_id, t.poi_name, t.poi_description '
+        f'FROM {POI_TEMP_TABLE} t LEFT JOIN {POI_TABLE} p ON p.poi_id = t.poi_id '
+        f'WHERE p.poi_id IS NULL' + (f' OR {changed}' if upsert else '')
+    ]
+    if upsert:
+        statements.insert(0,
+            f'INSERT INTO "{POI_FTS_TABLE}" ("{POI_FTS_TABLE}", rowid, {FTS_COLUMNS}) '
+            f"SELECT 'delete', p.poi_id, p.poi_name, p.poi_description "
+            f'FROM {POI_TEMP_TABLE} t JOIN {POI_TABLE} p ON p.poi_id = t.poi_id WHERE {changed}'
+        )
+    return statements
+
+
+def rebuild_search_index(cursor):
+    # Re-reads the whole table, after a full refresh
+    cursor.execute(f'INSERT INTO "{POI_FTS_TABLE}" ("{POI_FTS_TABLE}") VALUES (\'rebuild\')')
+
+
+def index_text(cursor, poi_id):
+    # Indexes a row as it is stored now, after it was inserted or updated
+    cursor.execute(
+        f'INSERT INTO "{POI_FTS_TABLE}" (rowid, {FTS_COLUMNS}) '
+        f'SELECT poi_id, poi_name, poi_description FROM {POI_TABLE} WHERE poi_id = %s',
+        (poi_id,)
+    )
+
+
+def unindex_texts(cursor, poi_ids_sql, params):
+    # unindex_text() for every id a subquery selects, before a bulk delete
+    cursor.execute(
+        f'INSERT INTO "{POI_FTS_TABLE}" ("{POI_FTS_TABLE}", rowid, {FTS_COLUMNS}) '
+        f"SELECT 'delete', poi_id, poi_name, poi_description FROM {POI_TABLE} WHERE poi_id IN ({poi_ids_sql})",
+        params
+    )
+
+
+def unindex_text(cursor, poi_id):
+    # Removes a row with the text it has now, before it is updated or deleted
+    cursor.execute(
+        f'INSERT INTO "{POI_FTS_TABLE}" ("{POI_FTS_TABLE}", rowid, {FTS_COLUMNS}) '
+        f"SELECT 'delete', poi_id, poi_name, poi_description FROM {POI_TABLE} WHERE poi_id = %s",
+        (poi_id,)
+    )
@@ -0,0 +1,67 @@
+from geoDataImportApp.manifest import save_checkpoint
+from geoDataImportApp.querycache import bump_generation
+from geoDataImportApp.search import rebuild_search_index
+from geoDataImportApp.spatial import rebuild_spatial_index
+from geoDataImportApp.stats import rebuild_category_stats
+from geoDataImportApp.upsert import POI_TABLE
+
+POI_SHADOW_TABLE = 'geoDataImportApp_pointsofinterest_shadow'
+POI_RETIRED_TABLE = 'geoDataImportApp_pointsofinterest_retired'
+
+
+def create_shadow_table(cursor):
+    # Creates an empty copy of the live table with only its primary key, so the
+    # load never maintains secondary indexes row by row
+    cursor.execute(f'DROP TABLE IF EXISTS "{POI_SHADOW_TABLE}"')
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (POI_TABLE,))
+    table_sql = cursor.fetchone()[0]
+    cursor.execute(table_sql.replace(f'"{POI_TABLE}"', f'"{POI_SHADOW_TABLE}"', 1))
+
+
+def drop_shadow_table(cursor):
+    # A refresh that can't load every row leaves the live table as it is
+    cursor.execute(f'DROP TABLE IF EXISTS "{POI_SHADOW_TABLE}"')
+
+
+def table_schema(cursor):
+    # Index and trigger DDL of the live table, recreated on the shadow table once
+    # it has taken the live table's name
+    cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? AND sql IS NOT NULL "
+        "ORDER BY type = 'trigger'",
+        (POI_TABLE,)
+    )
+    return [sql for sql, in cursor.fetchall()]
+
+
+def swap_shadow_table(conn, checkpoints):
+    # Readers keep seeing the old table (WAL snapshot) until the commit, after
+    # which they see the new one. Indexes, the R*Tree, the full-text index and
+    # the category stats included, are built once, on the loaded table.
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        schema = table_schema(cursor)
+        cursor.execute(f'ALTER TABLE "{POI_TABLE}" RENAME TO "{POI_RETIRED_TABLE}"')
+        cursor.execute(f'DROP TABLE "{POI_RETIRED_TABLE}"')
+        cursor.execute(f'ALTER TABLE "{POI_SHADOW_TABLE}" RENAME TO "{POI_TABLE}"')
+        for sql in schema:
+            cursor.execute(sql)
+        rebuild_spatial_index(cursor)
+        rebuild_search_index(cursor)
+        rebuild_category_stats(cursor)
+
+        # Only the files loaded in this refresh are in the table now
+        cursor.execute(
+            "UPDATE geoDataImportApp_importmanifest "
+            "SET committed_offset = 0, committed_rows = 0, completed = 0"
+        )
+        for checkpoint in checkpoints:
+            save_checkpoint(cursor, checkpoint)
+        bump_generation(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
@@ -0,0 +1,122 @@
+import math
+import numpy as np
+from geoDataImportApp.upsert import POI_TABLE, POI_TEMP_TABLE
+
+# R*Tree over every PoI's coordinates, one zero-size box per point. It stores
+# 32-bit floats rounded outwards, so it is only a prefilter: bounding-box
+# queries look the candidates up in the main table and check the exact values.
+POI_RTREE_TABLE = 'geoDataImportApp_pointsofinterest_rtree'
+RTREE_COLUMNS = 'poi_id, min_latitude, max_latitude, min_longitude, max_longitude'
+POINT_BOX = 'poi_id, poi_latitude, poi_latitude, poi_longitude, poi_longitude'
+
+CREATE_RTREE_SQL = f'CREATE VIRTUAL TABLE IF NOT EXISTS "{POI_RTREE_TABLE}" USING rtree({RTREE_COLUMNS})'
+RTREE_BBOX_SQL = (
+    f'SELECT poi_id FROM "{POI_RTREE_TABLE}" '
+    f'WHERE max_latitude >= %s AND min_latitude <= %s AND max_longitude >= %s AND min_longitude <= %s'
+)
+
+EARTH_RADIUS = 6371008.8  # metres
+# Without a radius the k-nearest search starts with a small circle and widens
+# it until it holds k PoIs, each step is one R*Tree lookup
+NEAREST_START_RADIUS = 1000
+NEAREST_GROWTH = 4
+
+
+def unindex_staged_points_sql(upsert=False):
+    # Runs in the writer's group commit, before the staged rows are copied into
+    # the main table: with upsert, rows whose coordinates are about to change
+    # lose their entry. They are found by comparing with the main table, the
+    # R*Tree itself can't be read while it is written to.
+    if not upsert:
+        return []
+    return [
+        f'DELETE FROM "{POI_RTREE_TABLE}" WHERE poi_id IN ('
+        f'SELECT t.poi_id FROM {POI_TEMP_TABLE} t JOIN {POI_TABLE} p ON p.poi_id = t.poi_id '
+        f'WHERE p.poi_latitude IS NOT t.poi_latitude OR p.poi_longitude IS NOT t.poi_longitude)'
+    ]
+
+
+def index_copied_points_sql():
+    # After the copy, every staged id without an entry gets one, with the
+    # coordinates that reached the main table. A staged row the main table
+    # didn't take indexes nothing.
+    return (
+        f'INSERT OR IGNORE INTO "{POI_RTREE_TABLE}" ({RTREE_COLUMNS}) '
+        f'SELECT {", ".join(f"p.{column}" for column in POINT_BOX.split(", "))} '
+        f'FROM {POI_TEMP_TABLE} t JOIN {POI_TABLE} p ON p.poi_id = t.poi_id'
+    )
+
+
+def rebuild_spatial_index(cursor):
+    # After a full refresh the whole table is new, so the index is refilled in one go
+    cursor.execute(f'DELETE FROM "{POI_RTREE_TABLE}"')
+    cursor.execute(f'INSERT INTO "{POI_RTREE_TABLE}" ({RTREE_COLUMNS}) SELECT {POINT_BOX} FROM {POI_TABLE}')
+
+
+def index_point(cursor, poi_id, latitude, longitude):
+    cursor.execute(
+        f'INSERT OR REPLACE INTO "{POI_RTREE_TABLE}" ({RTREE_COLUMNS}) VALUES (%s, %s, %s, %s, %s)',
+        (poi_id, latitude, latitude, longitude, longitude)
+    )
+
+
+def unindex_point(cursor, poi_id):
+    cursor.execute(f'DELETE FROM "{POI_RTREE_TABLE}" WHERE poi_id = %s', (poi_id,))
+
+
+def unindex_points(cursor, poi_ids_sql, params):
+    # unindex_point() for every id a subquery selects
+    cursor.execute(f'DELETE FROM "{POI_RTREE_TABLE}" WHERE poi_id IN ({poi_ids_sql})', params)
+
+
+def radius_bbox(latitude, longitude, radius):
+    # (south, west, north, east) of the smallest box around a circle of radius
+    # metres. West > east when it crosses the antimeridian; a circle around a
+    # pole gets every longitude.
+    angle = radius / EARTH_RADIUS
+    south = latitude - math.degrees(angle)
+    north = latitude + math.degrees(angle)
+    if south <= -90 or north >= 90 or angle >= math.pi / 2:
+        return max(south, -90), -180, min(north, 90), 180
+    delta = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(latitude))))
+    west, east = longitude - delta, longitude + delta
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
+
+
+def haversine(latitude, longitude, latitudes, longitudes):
+    # Great-circle distances in metres from one point to arrays of points
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((latitudes - latitude) / 2) ** 2 + math.cos(latitude) * np.cos(latitudes) * np.sin((longitudes - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def find_nearest(queryset, latitude, longitude, k, radius=None, fields=('poi_id',), fetch=list):
+    # The k PoIs of the queryset closest to a point, optionally no further than
+    # radius metres, as (values, distance) pairs sorted by distance. Candidates
+    # come from the R*Tree box around a circle and their exact distances are
+    # worked out all at once. The circle starts small and grows, to at most the
+    # radius, until it holds k PoIs: nothing outside it can be closer than those.
+    # fetch() runs the values_list() querysets, readpool.read_rows on a pool thread.
+    search_radius = NEAREST_START_RADIUS if radius is None else min(radius, NEAREST_START_RADIUS)
+    while True:
+        candidates = queryset.within_bbox(*radius_bbox(latitude, longitude, search_radius))
+        rows = fetch(candidates.values_list('poi_id', 'poi_latitude', 'poi_longitude'))
+        coordinates = np.array([row[1:] for row in rows], dtype=float).reshape(-1, 2)
+        distances = haversine(latitude, longitude, coordinates[:, 0], coordinates[:, 1])
+        inside = np.flatnonzero(distances <= search_radius)
+        if len(inside) >= k or search_radius == radius or search_radius >= math.pi * EARTH_RADIUS:
+            break
+        # Aim straight for k PoIs at the density seen so far
+        search_radius *= min(NEAREST_GROWTH, 1.25 * math.sqrt(k / len(inside))) if len(inside) else NEAREST_GROWTH
+        if radius is not None:
+            search_radius = min(search_radius, radius)
+
+    nearest = inside[np.argsort(distances[inside], kind='stable')[:k]]
+    poi_ids = [rows[index][0] for index in nearest]
+    values = {row[0]: row[1:] for row in fetch(queryset.filter(poi_id__in=poi_ids).values_list('poi_id', *fields))}
+    return [(values[poi_id], float(distance)) for poi_id, distance in zip(poi_ids, distances[nearest])]
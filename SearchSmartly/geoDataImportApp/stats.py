@@ -0,0 +1,107 @@
+from geoDataImportApp.upsert import POI_TABLE, POI_TEMP_TABLE
+
+# One row of aggregates per poi_category, so dashboards read a handful of rows
+# instead of grouping the whole table. The writer's group commit adds what its
+# staged rows change, like the R*Tree and the full-text index; the bounding box
+# can only grow that way, so a category whose box loses a corner point gets it
+# worked out again from its rows in the main table.
+CATEGORY_STATS_TABLE = 'geoDataImportApp_categorystats'
+# PoIs are counted by their average rating rounded to the nearest star
+RATING_STARS = range(1, 6)
+SUM_COLUMNS = (
+    'poi_count', 'rated_count', 'rating_count', 'rating_sum',
+    *(f'rated_{stars}' for stars in RATING_STARS),
+)
+BBOX_COLUMNS = ('min_latitude', 'max_latitude', 'min_longitude', 'max_longitude')
+STATS_COLUMNS = ('poi_category',) + SUM_COLUMNS + BBOX_COLUMNS
+
+
+def aggregates(alias):
+    # SELECT list of every column but poi_category, named after them, over the
+    # rows of alias grouped by category
+    stars = f'MIN(5, MAX(1, CAST({alias}.average_rating + 0.5 AS INTEGER)))'
+    expressions = [
+        'COUNT(*)',
+        f'SUM({alias}.rating_count > 0)',
+        f'SUM({alias}.rating_count)',
+        f'SUM({alias}.rating_sum)',
+        *(f'SUM({alias}.rating_count > 0 AND {stars} = {star})' for star in RATING_STARS),
+        f'MIN({alias}.poi_latitude)', f'MAX({alias}.poi_latitude)',
+        f'MIN({alias}.poi_longitude)', f'MAX({alias}.poi_longitude)',
+    ]
+    return ', '.join(f'{expression} AS {column}' for expression, column in zip(expressions, SUM_COLUMNS + BBOX_COLUMNS))
+
+
+def staged_stats_sql(upsert=False):
+    # Runs next to unindex_staged_points_sql(), before the staged rows are copied.
+    # With upsert, the stored version of every row about to change is taken out
+    # first; a category whose box it sat on loses its box (NULL), which the
+    # scalar MIN()/MAX() of the second statement keep until settle_category_stats().
+    added = (
+        f'INSERT INTO "{CATEGORY_STATS_TABLE}" ({", ".join(STATS_COLUMNS)}) '
+        f'SELECT t.poi_category, {aggregates("t")} '
+        f'FROM {POI_TEMP_TABLE} t LEFT JOIN {POI_TABLE} p ON p.poi_id = t.poi_id '
+        f'WHERE p.poi_id IS NULL' + (' OR p.content_hash IS NOT t.content_hash' if upsert else '') + ' '
+        f'GROUP BY t.poi_category '
+        f'ON CONFLICT (poi_category) DO UPDATE SET '
+        + ', '.join(
+            [f'{column} = {column} + excluded.{column}' for column in SUM_COLUMNS]
+            + [f'{column} = {column[:3].upper()}({column}, excluded.{column})' for column in BBOX_COLUMNS]
+        )
+    )
+    if not upsert:
+        return [added]
+
+    on_box = (
+        'd.min_latitude <= s.min_latitude OR d.max_latitude >= s.max_latitude '
+        'OR d.min_longitude <= s.min_longitude OR d.max_longitude >= s.max_longitude'
+    )
+    removed = (
+        f'UPDATE "{CATEGORY_STATS_TABLE}" AS s SET '
+        + ', '.join(
+            [f'{column} = s.{column} - d.{column}' for column in SUM_COLUMNS]
+            + [f'{column} = CASE WHEN {on_box} THEN NULL ELSE s.{column} END' for column in BBOX_COLUMNS]
+        )
+        + f' FROM (SELECT p.poi_category, {aggregates("p")} '
+        f'FROM {POI_TEMP_TABLE} t JOIN {POI_TABLE} p ON p.poi_id = t.poi_id '
+        f'WHERE p.content_hash IS NOT t.content_hash GROUP BY p.poi_category) AS d '
+        f'WHERE s.poi_category = d.poi_category'
+    )
+    return [removed, added]
+
+
+def settle_category_stats(cursor):
+    # After the copy: boxes dropped by staged_stats_sql() are read back off the
+    # category's rows (a range of poi_category_idx), emptied categories go
+    cursor.execute(
+        f'UPDATE "{CATEGORY_STATS_TABLE}" SET ({", ".join(BBOX_COLUMNS)}) = ('
+        f'SELECT MIN(poi_latitude), MAX(poi_latitude), MIN(poi_longitude), MAX(poi_longitude) '
+        f'FROM {POI_TABLE} WHERE poi_category = "{CATEGORY_STATS_TABLE}".poi_category'
+        f') WHERE min_latitude IS NULL'
+    )
+    cursor.execute(f'DELETE FROM "{CATEGORY_STATS_TABLE}" WHERE poi_count <= 0')
+
+
+def rebuild_category_stats(cursor):
+    # One GROUP BY over the whole table, for a full refresh
+    cursor.execute(f'DELETE FROM "{CATEGORY_STATS_TABLE}"')
+    cursor.execute(
+        f'INSERT INTO "{CATEGORY_STATS_TABLE}" ({", ".join(STATS_COLUMNS)}) '
+        f'SELECT p.poi_category, {aggregates("p")} FROM {POI_TABLE} p GROUP BY p.poi_category'
+    )
+
+
+def refresh_category_stats(cursor, categories):
+    # Works the given categories out again from their rows, for single saves and
+    # queryset updates that don't know what they changed
+    categories = list(set(categories))
+    if not categories:
+        return
+    placeholders = ', '.join(['%s'] * len(categories))
+    cursor.execute(f'DELETE FROM "{CATEGORY_STATS_TABLE}" WHERE poi_category IN ({placeholders})', categories)
+    cursor.execute(
+        f'INSERT INTO "{CATEGORY_STATS_TABLE}" ({", ".join(STATS_COLUMNS)}) '
+        f'SELECT p.poi_category, {aggregates("p")} FROM {POI_TABLE} p '
+        f'WHERE p.poi_category IN ({placeholders}) GROUP BY p.poi_category',
+        categories
+    )
@@ -0,0 +1,227 @@
+import io
+import os
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from geoDataImportApp.readers import DECOMPRESS_CHUNK_SIZE, DecompressingReader, get_compression
+
+QUEUE_SAMPLE_INTERVAL = 0.25
+TRACEMALLOC_TOP_LINES = 20
+
+
+class ImportTelemetry:
+    # Collects what an import spends its time on. Stage times are exclusive (a
+    # 'read' inside 'parse' only counts as read) and are summed over threads and
+    # worker processes, so together they can exceed the run's wall time.
+
+    def __init__(self, profile_dir=None):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start_time = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.stages = {}
+        self.counters = Counter()
+        self.rejected = Counter()
+        self.commit_latencies = []
+        self.queue_depths = []
+        self.queues = []
+        self.sampler = None
+        self.finished = threading.Event()
+        self.profile_dir = profile_dir
+        self.profile_files = []
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        stack = self.local.__dict__.setdefault('stack', [])
+        # Time spent in nested stages, subtracted from this one on exit
+        stack.append([0.0, 0.0])
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.thread_time() - start_cpu
+            nested_wall, nested_cpu = stack.pop()
+            if stack:
+                stack[-1][0] += wall
+                stack[-1][1] += cpu
+            self.add_stage(name, wall - nested_wall, cpu - nested_cpu)
+
+    def add_stage(self, name, wall, cpu, calls=1):
+        with self.lock:
+            stage = self.stages.setdefault(name, {'wall_time': 0.0, 'cpu_time': 0.0, 'calls': 0})
+            stage['wall_time'] += wall
+            stage['cpu_time'] += cpu
+            stage['calls'] += calls
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def reject(self, reason):
+        with self.lock:
+            self.rejected[reason] += 1
+            self.counters['rows_rejected'] += 1
+
+    def commit(self, latency):
+        with self.lock:
+            self.commit_latencies.append(latency)
+
+    def snapshot(self):
+        # Picklable summary, used to hand worker process telemetry to the parent
+        with self.lock:
+            return {
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'counters': dict(self.counters),
+                'rejected': dict(self.rejected),
+            }
+
+    def merge(self, snapshot):
+        for name, stage in snapshot['stages'].items():
+            self.add_stage(name, stage['wall_time'], stage['cpu_time'], stage['calls'])
+        with self.lock:
+            self.counters.update(snapshot['counters'])
+            self.rejected.update(snapshot['rejected'])
+
+    def watch_queues(self, queues):
+        # Samples the depth of every queue (summed per name) until finish()
+        self.queues = list(queues)
+        self.sampler = threading.Thread(target=self.sample_queues, daemon=True)
+        self.sampler.start()
+
+    def sample_queues(self):
+        while not self.finished.wait(QUEUE_SAMPLE_INTERVAL):
+            depths = Counter()
+            for queue in self.queues:
+                depths[getattr(queue, 'name', 'queue')] += queue.qsize()
+            self.queue_depths.append({'time': round(time.perf_counter() - self.start_time, 3), **depths})
+
+    @contextmanager
+    def profile(self, name):
+        # cProfile and tracemalloc snapshot of one hot loop, only with --profile
+        if not self.profile_dir:
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # From Python 3.12 one profiler can be active per process, the first
+            # of the threads running the same loop gets it and the others go without
+            print(f"Not profiling '{name}': {e}")
+            profiler = None
+        if profiler is None:
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self.lock:
+                base = os.path.join(self.profile_dir, f"{name}-{len(self.profile_files) + 1}")
+                self.profile_files.append(base)
+            profiler.dump_stats(base + '.prof')
+            tracemalloc.take_snapshot().dump(base + '.tracemalloc')
+
+    def finish(self):
+        self.finished.set()
+        if self.sampler:
+            self.sampler.join()
+        self.wall_time = time.perf_counter() - self.start_time
+        self.cpu_time = time.process_time() - self.start_cpu
+
+    def report(self, **details):
+        rows_read = self.counters['rows_read']
+        latencies = sorted(self.commit_latencies)
+        report = {
+            **details,
+            'started_at': self.started_at,
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'rows': dict(self.counters),
+            'rows_per_second': rows_read / self.wall_time if self.wall_time else 0,
+            'stages': self.stages,
+            'rejected': dict(self.rejected),
+            'commits': {
+                'count': len(latencies),
+                'total': sum(latencies),
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+                'max': latencies[-1] if latencies else 0,
+                'latencies': self.commit_latencies,
+            },
+            'queue_depths': self.queue_depths,
+        }
+        if self.profile_dir:
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:TRACEMALLOC_TOP_LINES]
+            report['profile'] = {
+                'files': [base + suffix for base in self.profile_files for suffix in ('.prof', '.tracemalloc')],
+                'tracemalloc_current': current,
+                'tracemalloc_peak': peak,
+                'tracemalloc_top': [str(statistic) for statistic in top],
+            }
+        return report
+
+    def write_report(self, path, **details):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.report(**details), file, indent=2, default=str)
+
+
+def percentile(values, fraction):
+    # values must be sorted
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class TimedRawFile(io.RawIOBase):
+    # Raw file whose reads are recorded as the 'read' stage. Buffered/text
+    # wrappers on top of it read in large chunks, so timing costs next to nothing.
+
+    def __init__(self, raw, telemetry):
+        self.raw = raw
+        self.telemetry = telemetry
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.raw.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def tell(self):
+        return self.raw.tell()
+
+    def readinto(self, buffer):
+        with self.telemetry.stage('read'):
+            return self.raw.readinto(buffer)
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+def open_timed(file_path, telemetry, mode='rb', encoding='utf-8', newline=None):
+    # Compressed files are decompressed on the fly, in their own thread
+    file = io.BufferedReader(TimedRawFile(open(file_path, 'rb', buffering=0), telemetry), io.DEFAULT_BUFFER_SIZE * 16)
+    compression = get_compression(file_path)
+    if compression:
+        file = io.BufferedReader(DecompressingReader(file, compression, telemetry), DECOMPRESS_CHUNK_SIZE)
+    if mode == 'rb':
+        return file
+    return io.TextIOWrapper(file, encoding=encoding, newline=newline)
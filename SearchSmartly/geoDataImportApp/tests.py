@@ -1,3 +1,564 @@
-from django.test import TestCase
+import io
+import os
+import csv
+import json
+import random
+import tempfile
+import tracemalloc
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from contextlib import redirect_stdout
+from unittest import mock
+from queue import Queue
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from geoDataImportApp.management.commands.generate_poi_data import write_dataset
+from geoDataImportApp.management.commands.import_poi_data import save_to_database, validate_and_create_point
+from geoDataImportApp.management.commands import import_poi_data_lightning
+from geoDataImportApp.management.commands.import_poi_data_lightning import process_file, read_rows, validate_and_create_point as validate_row
+from geoDataImportApp.export import json_objects
+from geoDataImportApp.manifest import ImportCheckpoint, hash_file, load_manifest, save_checkpoint
+from geoDataImportApp.models import CategoryStats, ImportManifest, PointsOfInterest, QuarantinedRow
+from geoDataImportApp.quarantine import Quarantine
+from geoDataImportApp.ratings import pack_ratings
+from geoDataImportApp.readers import iter_json_records
+from geoDataImportApp.search import rebuild_search_index
+from geoDataImportApp.shadow import POI_SHADOW_TABLE
+from geoDataImportApp.spatial import POI_RTREE_TABLE, rebuild_spatial_index
+from geoDataImportApp.telemetry import ImportTelemetry, open_timed
+from geoDataImportApp.validation import rejection_reason, validate_batch
+from geoDataImportApp import writer
 
-# Create your tests here.
+POINTS = [
+    {'id': 1, 'name': 'Cafe [one]', 'coordinates': {'latitude': 51.5, 'longitude': -0.12}, 'category': 'cafe', 'ratings': [4.5, 3], 'description': 'Tea, "cake" and {braces}'},
+    {'id': 2, 'name': 'Zürich, ø', 'coordinates': {'latitude': 47.37, 'longitude': 8.54}, 'category': 'bar', 'ratings': [], 'description': ''},
+    {'id': 3, 'name': 'Backslash \\ ]', 'coordinates': {'latitude': -33.9, 'longitude': 151.2}, 'category': 'museum', 'ratings': [5], 'description': 'line\nbreak'},
+]
+
+
+class JsonReaderTests(SimpleTestCase):
+    def read(self, text, chunk_size):
+        return list(iter_json_records(io.StringIO(text), chunk_size=chunk_size))
+
+    def test_array_split_across_chunks(self):
+        # Every chunk size up to the length of a record puts a boundary inside
+        # a key, a string, a number and between records somewhere
+        text = json.dumps(POINTS, ensure_ascii=False, indent=1)
+        for chunk_size in range(1, len(json.dumps(POINTS[0])) + 2):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.read(text, chunk_size), POINTS)
+
+    def test_ndjson_split_across_chunks(self):
+        text = '\n'.join(json.dumps(point, ensure_ascii=False) for point in POINTS) + '\n\n'
+        for chunk_size in (1, 2, 7, 64, 4096):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.read(text, chunk_size), POINTS)
+
+    def test_ndjson_without_final_newline(self):
+        text = '\n'.join(json.dumps(point) for point in POINTS)
+        self.assertEqual(self.read(text, 16), POINTS)
+
+    def test_array_after_leading_whitespace(self):
+        # The format is told by the first character that isn't whitespace, even
+        # when the first chunks hold nothing else
+        text = ' \n\t ' * 10 + json.dumps(POINTS)
+        self.assertEqual(self.read(text, 3), POINTS)
+
+    def test_empty_array(self):
+        self.assertEqual(self.read('[ ]', 1), [])
+        self.assertEqual(self.read('', 8), [])
+
+    def test_truncated_array(self):
+        text = json.dumps(POINTS)[:-1]
+        with self.assertRaises(ValueError):
+            self.read(text, 5)
+
+    def test_missing_comma(self):
+        text = json.dumps(POINTS[0]) + ' ' + json.dumps(POINTS[1])
+        with self.assertRaises(ValueError):
+            self.read('[' + text + ']', 5)
+
+
+class ValidationTests(SimpleTestCase):
+    EDGE_ROWS = [
+        ['1', 'Empty ratings', 'cafe', '1.5', '2.5', '{}'],
+        ['2', 'No ratings at all', 'cafe', '1.5', '2.5', ''],
+        ['3', 'Blank ratings', 'cafe', '1.5', '2.5', '{ , ,}', 'description'],
+        ['4', 'Spaced ratings', 'cafe', '1.5', '2.5', '{ 4.5 , 3 ,}'],
+        [' 5 ', 'Spaced id', 'cafe', ' -1.5 ', ' 2.5 ', '{1}'],
+        ['6', 'Bad rating', 'cafe', '1.5', '2.5', '{4.0,bad}'],
+        ['7', 'Short row', 'cafe', '1.5'],
+        ['8', 'Missing ratings', 'cafe', '1.5', '2.5', None],
+        ['9', 'Off the map', 'cafe', '90.5', '2.5', '{1}'],
+        ['10', '', 'cafe', '1.5', '2.5', '{1}'],
+        ['11', 'No category', None, '1.5', '2.5', '{1}'],
+        ['12', 'Null description', 'cafe', '1.5', '2.5', '{1}', None],
+        ['1e3', 'Float id', 'cafe', '1.5', '2.5', '{1}'],
+        [],
+    ]
+
+    def assertBatchMatchesRows(self, rows, data_origin):
+        rejected = []
+        batch = validate_batch(rows, data_origin, rejected)
+        self.assertEqual(batch, [point for point in map(validate_row, rows, repeat(data_origin)) if point])
+        self.assertEqual(rejected, [index for index, row in enumerate(rows) if not validate_row(row, data_origin)])
+        return rejected
+
+    def test_generated_dataset(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            for name in ('pois.csv', 'pois.json'):
+                with self.subTest(name=name):
+                    file_path = os.path.join(work_dir, name)
+                    write_dataset(file_path, 5000, seed=3, invalid_rate=0.05, duplicate_rate=0.05)
+                    rows = list(read_rows(file_path, name.split('.')[-1], {'offset': 0}, ImportTelemetry()))
+                    self.assertGreater(len(self.assertBatchMatchesRows(rows, name.split('.')[-1])), 100)
+
+    def test_edge_rows(self):
+        self.assertEqual(self.assertBatchMatchesRows(self.EDGE_ROWS, 'csv'), [5, 6, 7, 8, 9, 10, 11, 12, 13])
+        self.assertEqual([rejection_reason(row) for row in self.EDGE_ROWS[9:12]], ['missing required fields'] * 3)
+
+
+class ReadRowsTests(SimpleTestCase):
+    def test_files_are_closed(self):
+        opened = []
+
+        def open_tracked(*args, **kwargs):
+            opened.append(open_timed(*args, **kwargs))
+            return opened[-1]
+
+        with tempfile.TemporaryDirectory() as work_dir, mock.patch.object(import_poi_data_lightning, 'open_timed', open_tracked):
+            for name in ('pois.csv', 'pois.json', 'pois.xml', 'pois.csv.gz'):
+                with self.subTest(name=name):
+                    file_path = os.path.join(work_dir, name)
+                    write_dataset(file_path, 100)
+                    file_format = name.split('.')[1]
+                    self.assertEqual(len(list(read_rows(file_path, file_format, {'offset': 0}, ImportTelemetry()))), 100)
+                    # Also when the reader stops part way
+                    rows = read_rows(file_path, file_format, {'offset': 0}, ImportTelemetry())
+                    next(rows)
+                    rows.close()
+                    self.assertTrue(all(file.closed for file in opened))
+
+
+class TelemetryTests(SimpleTestCase):
+    def test_profile_with_another_profiler_active(self):
+        # What cProfile raises on Python 3.12+ when another thread is being profiled
+        with tempfile.TemporaryDirectory() as profile_dir:
+            telemetry = ImportTelemetry(profile_dir)
+            self.addCleanup(tracemalloc.stop)
+            active = ValueError('Another profiling tool is already active')
+            with mock.patch('cProfile.Profile.enable', side_effect=active), redirect_stdout(io.StringIO()) as output:
+                with telemetry.profile('validate'):
+                    pass
+            with telemetry.profile('write'):
+                pass
+            self.assertIn("Not profiling 'validate'", output.getvalue())
+            self.assertEqual(telemetry.profile_files, [os.path.join(profile_dir, 'write-1')])
+
+
+
+class ExportTests(SimpleTestCase):
+    def row(self, latitude=51.5, longitude=-0.1, ratings=(4.5, 3.0)):
+        return (1, 'Cafe "Zed"', 'cafe', latitude, longitude, None, pack_ratings(list(ratings)), 'good\ncoffee')
+
+    def test_json_floats_round_trip(self):
+        record = json.loads(json_objects([self.row(latitude=0.1 + 0.2, ratings=(1e-7, 4.0))])[0])
+        self.assertEqual(record['coordinates'], {'latitude': 0.1 + 0.2, 'longitude': -0.1})
+        self.assertEqual(record['ratings'], [1e-7, 4.0])
+        self.assertEqual(record['name'], 'Cafe "Zed"')
+
+    def test_json_refuses_non_finite_floats(self):
+        for row in (self.row(ratings=(float('nan'),)), self.row(longitude=float('inf'))):
+            with self.assertRaises(ValueError):
+                json_objects([row])
+
+class ResumeTests(TestCase):
+    def setUp(self):
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        self.work_dir = work_dir.name
+
+    def read(self, file_path, manifest):
+        # The batches and checkpoints the lightning reader queues for the writer
+        db_queue = Queue()
+        process_file(file_path, file_path.split('.')[-1], db_queue, manifest, ImportTelemetry(), Quarantine())
+        batches, checkpoints = [], []
+        while not db_queue.empty():
+            item = db_queue.get()
+            (checkpoints if isinstance(item, ImportCheckpoint) else batches).append(item)
+        return batches, checkpoints
+
+    def test_resume_from_checkpoint(self):
+        # Resuming from the first checkpoint of a run reads the rest of the file
+        # exactly as that run did
+        for file_format in ('csv', 'json'):
+            with self.subTest(file_format=file_format):
+                file_path = os.path.join(self.work_dir, f"pois.{file_format}")
+                write_dataset(file_path, 25000)
+                batches, checkpoints = self.read(file_path, ImportManifest(file_path=file_path))
+                self.assertEqual(len(batches), 3)
+                self.assertTrue(checkpoints[-1].completed)
+
+                first = checkpoints[0]
+                manifest = ImportManifest(file_path=file_path, committed_offset=first.offset or 0, committed_rows=first.rows)
+                resumed_batches, resumed_checkpoints = self.read(file_path, manifest)
+                self.assertEqual(resumed_batches, batches[1:])
+                self.assertEqual(resumed_checkpoints, checkpoints[1:])
+
+    def test_manifest_keeps_progress_until_the_file_changes(self):
+        file_path = os.path.join(self.work_dir, 'pois.csv')
+        write_dataset(file_path, 100)
+        self.assertEqual(load_manifest(file_path).committed_rows, 0)
+        with connection.cursor() as cursor:
+            save_checkpoint(cursor, ImportCheckpoint(file_path, 1234, 50, False))
+
+        manifest = load_manifest(file_path)
+        self.assertEqual((manifest.committed_offset, manifest.committed_rows, manifest.completed), (1234, 50, False))
+
+        with open(file_path, 'a') as file:
+            file.write('101,Place 101,category-1,1.0,2.0,{3.0}\n')
+        manifest = load_manifest(file_path)
+        self.assertEqual((manifest.committed_offset, manifest.committed_rows), (0, 0))
+        self.assertEqual(load_manifest(file_path, force=True).committed_rows, 0)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        # Results are cached by dataset generation, which every test starts over
+        cache.clear()
+        PointsOfInterest.objects.create(
+            poi_id=1, poi_name='Eiffel Tower', poi_latitude=48.858, poi_longitude=2.294, poi_category='landmark',
+            poi_ratings='{5.0}', poi_description='Wrought-iron tower', data_origin='csv',
+        )
+
+    def test_search(self):
+        response = self.client.get('/geo/search', {'q': 'eiff tow'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['poi_id'] for result in response.json()['results']], [1])
+
+    def test_update_and_delete_results(self):
+        # search() only filters and annotates, so its querysets can be updated and deleted like any other
+        self.assertEqual(PointsOfInterest.objects.search('eiffel').append_ratings([3.0]), 1)
+        self.assertEqual(PointsOfInterest.objects.get(poi_id=1).poi_ratings, '{5.0,3.0}')
+        PointsOfInterest.objects.search('tower').delete()
+        self.assertFalse(PointsOfInterest.objects.exists())
+        self.assertFalse(PointsOfInterest.objects.search('tower').exists())
+
+    def test_query_without_words(self):
+        # Nothing is left to match once punctuation is dropped
+        self.assertFalse(PointsOfInterest.objects.search('!!!').exists())
+        for query in ('!!!', '"*"', ' - '):
+            with self.subTest(query=query):
+                response = self.client.get('/geo/search', {'q': query})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    async def test_async_query_without_words(self):
+        response = await self.async_client.get('/geo/async/search', {'q': '!!!'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+
+class CategoryStatsTests(TestCase):
+    def import_rows(self, rows, upsert=False):
+        # Through the ORM importer's writer, one batch at a time like a run
+        db_queue = Queue()
+        for start in range(0, len(rows), 40):
+            db_queue.put([
+                validate_and_create_point(row, index, 'csv', [])
+                for index, row in enumerate(rows[start:start + 40], start=start + 1)
+            ])
+        db_queue.put(None)
+        save_to_database(db_queue, threading.Event(), ImportTelemetry(), upsert)
+
+    def row(self, rng, poi_id, category=None):
+        ratings = [round(rng.uniform(1, 5), 1) for _ in range(rng.randint(0, 4))]
+        return {
+            'poi_id': str(poi_id), 'poi_name': f"Place {poi_id}", 'poi_description': '',
+            'poi_latitude': str(rng.uniform(-80, 80)), 'poi_longitude': str(rng.uniform(-170, 170)),
+            'poi_category': category or rng.choice(['cafe', 'bar', 'museum']),
+            'poi_ratings': '{' + ','.join(map(str, ratings)) + '}',
+        }
+
+    def assertStatsMatchRows(self):
+        expected = {}
+        for point in PointsOfInterest.objects.all():
+            stats = expected.setdefault(point.poi_category, {
+                'poi_count': 0, 'rated_count': 0, 'rating_count': 0, 'rating_sum': 0,
+                **{f'rated_{stars}': 0 for stars in range(1, 6)},
+                'min_latitude': 90, 'max_latitude': -90, 'min_longitude': 180, 'max_longitude': -180,
+            })
+            stats['poi_count'] += 1
+            stats['rating_count'] += point.rating_count
+            stats['rating_sum'] = round(stats['rating_sum'] + point.rating_sum, 6)
+            if point.rating_count:
+                stats['rated_count'] += 1
+                stats[f'rated_{min(5, max(1, int(point.average_rating + 0.5)))}'] += 1
+            stats['min_latitude'] = min(stats['min_latitude'], point.poi_latitude)
+            stats['max_latitude'] = max(stats['max_latitude'], point.poi_latitude)
+            stats['min_longitude'] = min(stats['min_longitude'], point.poi_longitude)
+            stats['max_longitude'] = max(stats['max_longitude'], point.poi_longitude)
+
+        stored = {}
+        for category_stats in CategoryStats.objects.all():
+            stats = {field.name: getattr(category_stats, field.name) for field in CategoryStats._meta.fields if field.name != 'poi_category'}
+            stats['rating_sum'] = round(stats['rating_sum'], 6)
+            stored[category_stats.poi_category] = stats
+        self.assertEqual(stored, expected)
+
+    def test_import_and_upsert(self):
+        rng = random.Random(1)
+        rows = [self.row(rng, poi_id) for poi_id in range(1, 201)]
+        self.import_rows(rows)
+        self.assertStatsMatchRows()
+
+        # A second plain import leaves existing ids alone
+        self.import_rows([self.row(rng, poi_id) for poi_id in range(150, 251)])
+        self.assertStatsMatchRows()
+
+        # Changed rows move between categories, lose or gain ratings and leave
+        # the corners of their category's box; the last version of an id wins
+        corners = [
+            PointsOfInterest.objects.filter(poi_category='cafe').order_by(field).values_list('poi_id', flat=True).first()
+            for field in ('poi_latitude', '-poi_latitude', 'poi_longitude', '-poi_longitude')
+        ]
+        changed = [self.row(rng, poi_id) for poi_id in rng.sample(range(1, 251), 60) + corners]
+        changed += [self.row(rng, poi_id, 'zoo') for poi_id in range(240, 261)]
+        self.import_rows(rows[:20] + changed, upsert=True)
+        self.assertStatsMatchRows()
+
+    def test_delete(self):
+        rng = random.Random(2)
+        self.import_rows([self.row(rng, poi_id) for poi_id in range(1, 101)])
+        PointsOfInterest.objects.filter(poi_id__lte=30).delete()
+        self.assertStatsMatchRows()
+        PointsOfInterest.objects.get(poi_id=50).delete()
+        self.assertStatsMatchRows()
+
+        # Search results and a map viewport are deleted although their filters read
+        # the indexes the delete changes, an emptied category goes
+        PointsOfInterest.objects.search('place 60').delete()
+        PointsOfInterest.objects.within_bbox(0, 0, 90, 180).delete()
+        PointsOfInterest.objects.filter(poi_category='bar').delete()
+        self.assertFalse(PointsOfInterest.objects.filter(poi_id=60).exists())
+        self.assertFalse(PointsOfInterest.objects.filter(poi_latitude__gte=0, poi_longitude__gte=0).exists())
+        self.assertFalse(CategoryStats.objects.filter(poi_category='bar').exists())
+        self.assertStatsMatchRows()
+
+
+class ImporterTestCase(TransactionTestCase):
+    # The fast and lightning importers write through their own sqlite3
+    # connection, which a TestCase transaction would lock out
+
+    def setUp(self):
+        # The flush after every test only empties the model tables
+        with connection.cursor() as cursor:
+            rebuild_spatial_index(cursor)
+            rebuild_search_index(cursor)
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        self.work_dir = work_dir.name
+
+    def run_command(self, *args, **options):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            call_command(*args, stdout=output, **options)
+        return output.getvalue()
+
+    def dataset(self, name, rows, seed=0):
+        file_path = os.path.join(self.work_dir, name)
+        write_dataset(file_path, rows, seed, invalid_rate=0, duplicate_rate=0)
+        return file_path
+
+
+class FullRefreshTests(ImporterTestCase):
+    def setUp(self):
+        super().setUp()
+        self.run_command('import_poi_data_lightning', self.dataset('live.csv', 300))
+        self.live = list(PointsOfInterest.objects.order_by('poi_id').values_list('poi_id', 'poi_name'))
+        self.assertEqual(len(self.live), 300)
+
+    def assertLiveTableKept(self, *files):
+        with self.assertRaisesMessage(CommandError, 'Full refresh aborted'):
+            self.run_command('import_poi_data_lightning', *files, full_refresh=True)
+        self.assertEqual(list(PointsOfInterest.objects.order_by('poi_id').values_list('poi_id', 'poi_name')), self.live)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = %s", [POI_SHADOW_TABLE])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_refresh(self):
+        self.run_command('import_poi_data_lightning', self.dataset('new.json', 100, seed=1), full_refresh=True)
+        self.assertEqual(PointsOfInterest.objects.count(), 100)
+
+    def test_unreadable_file(self):
+        truncated = self.dataset('broken.csv.gz', 2000, seed=1)
+        with open(truncated, 'r+b') as file:
+            file.truncate(os.path.getsize(truncated) // 2)
+        self.assertLiveTableKept(self.dataset('new.csv', 100, seed=2), truncated)
+
+    def test_skipped_argument(self):
+        missing = os.path.join(self.work_dir, 'missing.csv')
+        self.assertLiveTableKept(self.dataset('new.csv', 100, seed=2), missing)
+
+
+class WriteFailureTests(ImporterTestCase):
+    def broken_json(self):
+        # A list can't be bound as a parameter, so the writer fails on this record
+        file_path = self.dataset('pois.json', 1000)
+        with open(file_path) as file:
+            records = json.load(file)
+        records[700]['name'] = ['not', 'a', 'name']
+        with open(file_path, 'w') as file:
+            json.dump(records, file)
+        return file_path
+
+    def test_failed_group_saves_no_checkpoint(self):
+        file_path = self.broken_json()
+        for _ in range(2):
+            with self.assertRaisesMessage(CommandError, 'Error inserting data'):
+                self.run_command('import_poi_data_lightning', file_path)
+            manifest = ImportManifest.objects.get(file_path=file_path)
+            self.assertFalse(manifest.completed)
+            self.assertLessEqual(manifest.committed_rows, PointsOfInterest.objects.count())
+
+    def test_fast_importer_reports_failure(self):
+        with self.assertRaisesMessage(CommandError, 'Error inserting data'):
+            self.run_command('import_poi_data_fast', self.broken_json())
+
+    def test_resume_after_write_failure(self):
+        file_path = self.dataset('pois.csv', 30000)
+        commit_group = writer.commit_group
+        calls = []
+
+        def fail_third_group(conn, *args):
+            calls.append(args)
+            if len(calls) == 3:
+                conn.rollback()
+                return 'Error committing data: disk I/O error'
+            return commit_group(conn, *args)
+
+        with mock.patch.object(writer, 'commit_group', fail_third_group):
+            with self.assertRaisesMessage(CommandError, 'disk I/O error'):
+                self.run_command('import_poi_data_lightning', file_path, commit_rows=10000, commit_interval=60)
+        manifest = ImportManifest.objects.get(file_path=file_path)
+        self.assertFalse(manifest.completed)
+        # A checkpoint may trail the rows committed with it, never run ahead of them
+        self.assertGreater(manifest.committed_rows, 0)
+        self.assertLessEqual(manifest.committed_rows, PointsOfInterest.objects.count())
+        self.assertLess(PointsOfInterest.objects.count(), 30000)
+
+        output = self.run_command('import_poi_data_lightning', file_path, commit_rows=10000, commit_interval=60)
+        self.assertIn(f"Resuming '{file_path}' after row {manifest.committed_rows}", output)
+        manifest.refresh_from_db()
+        self.assertTrue(manifest.completed)
+        self.assertEqual(PointsOfInterest.objects.count(), 30000)
+
+
+class CoordinateValidationTests(ImporterTestCase):
+    def setUp(self):
+        super().setUp()
+        self.file_path = os.path.join(self.work_dir, 'pois.csv')
+        with open(self.file_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["poi_id", "poi_name", "poi_category", "poi_latitude", "poi_longitude", "poi_ratings"])
+            for poi_id, (latitude, longitude) in enumerate([('nan', '0'), ('0', 'inf'), ('-91', '0'), ('0', '180.5'), ('-90', '180')], start=1):
+                writer.writerow([poi_id, f'place {poi_id}', 'cafe', latitude, longitude, '{4.0}'])
+
+    def assertOnlyValidRowImported(self, command, **options):
+        self.run_command(command, self.file_path, quarantine='table', **options)
+        self.assertEqual(list(PointsOfInterest.objects.values_list('poi_id', flat=True)), [5])
+        # The header is not validated, so it isn't quarantined either
+        self.assertEqual(list(QuarantinedRow.objects.order_by('row_index').values_list('row_index', flat=True)), [1, 2, 3, 4])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT poi_id FROM "{POI_RTREE_TABLE}"')
+            self.assertEqual(cursor.fetchall(), [(5,)])
+
+    def test_lightning(self):
+        self.assertOnlyValidRowImported('import_poi_data_lightning')
+
+    def test_lightning_vectorised(self):
+        self.assertOnlyValidRowImported('import_poi_data_lightning', vectorised=True)
+
+    def test_fast(self):
+        self.assertOnlyValidRowImported('import_poi_data_fast')
+
+    def test_orm(self):
+        self.assertOnlyValidRowImported('import_poi_data')
+
+
+class SpatialIndexTests(ImporterTestCase):
+    def write(self, points, upsert=False):
+        db_queue = Queue()
+        db_queue.put(points)
+        db_queue.put(None)
+        writer.save_to_database(db_queue, 1, ImportTelemetry(), upsert)
+
+    def point(self, poi_id, latitude, longitude):
+        # A validated row with its coordinates swapped in afterwards, so they can be anything
+        point = validate_row([str(poi_id), f'place {poi_id}', 'cafe', '0', '0', '{4.0}'], 'csv')
+        return point[:2] + (latitude, longitude) + point[4:]
+
+    def assertIndexMatchesTable(self, expected):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT poi_id, min_latitude, min_longitude FROM "{POI_RTREE_TABLE}" ORDER BY poi_id')
+            self.assertEqual(cursor.fetchall(), expected)
+        self.assertEqual(list(PointsOfInterest.objects.order_by('poi_id').values_list('poi_id', 'poi_latitude', 'poi_longitude')), expected)
+
+    def test_index_only_rows_that_reached_the_table(self):
+        # The main table keeps the first of two rows with one id, a NaN coordinate is stored as NULL
+        self.write([self.point(1, 10.5, 20.25), self.point(2, 11.5, 21.25), self.point(2, 12.5, 22.25), self.point(3, float('nan'), 0.0)])
+        self.assertIndexMatchesTable([(1, 10.5, 20.25), (2, 11.5, 21.25)])
+
+    def test_upsert_moves_points(self):
+        self.write([self.point(1, 10.5, 20.25), self.point(2, 11.5, 21.25)])
+        self.write([self.point(1, -30.5, 40.75), self.point(2, 11.5, 21.25), self.point(4, 1.5, 2.5)], upsert=True)
+        self.assertIndexMatchesTable([(1, -30.5, 40.75), (2, 11.5, 21.25), (4, 1.5, 2.5)])
+
+
+class ShardedImportTests(ImporterTestCase):
+    def test_spawned_workers_resume(self):
+        # Record n holds poi_id n, records 30 and 80 are invalid and the first 50 were committed before
+        lines = ["poi_id,poi_name,poi_category,poi_latitude,poi_longitude,poi_ratings\n"] + [
+            f"{'x' if record in (30, 80) else record},place {record},cafe,1.5,2.5,{{4.0}}\n" for record in range(1, 101)
+        ]
+        file_path = os.path.join(self.work_dir, 'pois.csv')
+        with open(file_path, 'w') as file:
+            file.writelines(lines)
+        ImportManifest.objects.create(
+            file_path=file_path, content_hash=hash_file(file_path), file_size=os.path.getsize(file_path),
+            committed_offset=len(''.join(lines[:51])), committed_rows=50,
+        )
+
+        spawn_pool = partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn'))
+        with mock.patch.object(import_poi_data_lightning, 'ProcessPoolExecutor', spawn_pool):
+            self.run_command('import_poi_data_lightning', file_path, workers=2, quarantine='table')
+        self.assertEqual(list(PointsOfInterest.objects.order_by('poi_id').values_list('poi_id', flat=True)), [
+            record for record in range(51, 101) if record != 80
+        ])
+        self.assertEqual(list(QuarantinedRow.objects.values_list('row_index', flat=True)), [80])
+        manifest = ImportManifest.objects.get(file_path=file_path)
+        self.assertTrue(manifest.completed)
+        self.assertEqual(manifest.committed_rows, 100)
+
+
+class FastImporterTests(ImporterTestCase):
+    def test_file_workers(self):
+        # Five files on two readers, the truncated one is reported once the others are written
+        files = [self.dataset(f'pois-{seed}.json', 200, seed) for seed in range(4)]
+        truncated = self.dataset('broken.json', 200, seed=4)
+        with open(truncated, 'r+b') as file:
+            file.truncate(os.path.getsize(truncated) // 2)
+        report_path = os.path.join(self.work_dir, 'report.json')
+        with self.assertRaisesMessage(CommandError, f"'{truncated}'"):
+            self.run_command('import_poi_data_fast', *files, truncated, file_workers=2, report=report_path)
+        with open(report_path) as file:
+            report = json.load(file)
+        self.assertEqual([file_path for file_path, _ in report['failed_files']], [truncated])
+        self.assertGreaterEqual(report['rows']['rows_read'], 800)
+        self.assertEqual(report['rows']['rows_valid'], report['rows']['rows_read'])
+        self.assertEqual(PointsOfInterest.objects.count(), 200)
@@ -0,0 +1,67 @@
+import hashlib
+
+POI_TABLE = 'geoDataImportApp_pointsofinterest'
+POI_TEMP_TABLE = 'geoDataImportApp_pointsofinterest_temp'
+POI_COLUMNS = (
+    'poi_id', 'poi_name', 'poi_latitude', 'poi_longitude', 'poi_category',
+    'poi_ratings', 'poi_description', 'data_origin', 'average_rating',
+    'rating_count', 'rating_sum', 'rating_min', 'rating_max', 'rating_values', 'content_hash',
+)
+CREATE_TEMP_TABLE_SQL = f"""CREATE TEMPORARY TABLE IF NOT EXISTS {POI_TEMP_TABLE} (
+                poi_id INTEGER UNIQUE PRIMARY KEY,
+                poi_name VARCHAR,
+                poi_latitude REAL,
+                poi_longitude REAL,
+                poi_category VARCHAR,
+                poi_ratings TEXT,
+                poi_description TEXT,
+                data_origin VARCHAR,
+                average_rating REAL,
+                rating_count INTEGER,
+                rating_sum REAL,
+                rating_min REAL,
+                rating_max REAL,
+                rating_values BLOB,
+                content_hash INTEGER)"""
+
+
+def content_hash(poi_name, poi_latitude, poi_longitude, poi_category, poi_ratings, poi_description, data_origin):
+    # 64-bit fingerprint of the source fields, signed so SQLite stores it as an INTEGER.
+    # average_rating is derived from poi_ratings, so it is left out.
+    content = repr((poi_name, poi_latitude, poi_longitude, poi_category, poi_ratings, poi_description, data_origin))
+    return int.from_bytes(hashlib.blake2b(content.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def with_content_hash(batch):
+    # Validated rows are (poi_id, ..., data_origin, average_rating, rating_count, ...) tuples
+    return [row + (content_hash(*row[1:8]),) for row in batch]
+
+
+def complete_rows(batch):
+    # Drops rows the main table would refuse (a missing name, category or
+    # description in a JSON or XML record). In upsert mode INSERT OR REPLACE
+    # fails the whole executemany() on one of them instead of skipping it.
+    return [row for row in batch if row[1] is not None and row[4] is not None and row[6] is not None]
+
+
+def insert_sql(table, upsert=False):
+    # Rows come from with_content_hash() in upsert mode, where the last occurrence
+    # of an id wins; otherwise the first one is kept
+    columns = POI_COLUMNS if upsert else POI_COLUMNS[:-1]
+    verb = 'INSERT OR REPLACE' if upsert else 'INSERT OR IGNORE'
+    return f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def copy_from_temp_sql(upsert=False):
+    columns = ', '.join(POI_COLUMNS)
+    if not upsert:
+        return f"INSERT OR IGNORE INTO {POI_TABLE} ({columns}) SELECT {columns} FROM {POI_TEMP_TABLE}"
+
+    # Existing rows are only rewritten when their content hash differs, so an
+    # unchanged row costs a primary key lookup and no write.
+    updates = ', '.join(f"{column} = excluded.{column}" for column in POI_COLUMNS[1:])
+    return (
+        f"INSERT INTO {POI_TABLE} ({columns}) SELECT {columns} FROM {POI_TEMP_TABLE} WHERE true "
+        f"ON CONFLICT (poi_id) DO UPDATE SET {updates} "
+        f"WHERE {POI_TABLE}.content_hash IS NOT excluded.content_hash"
+    )
@@ -4,4 +4,12 @@ from . import views
 
 urlpatterns = [
     path("", views.index, name="index"),
-]
\ No newline at end of file
+    path("nearby", views.nearby, name="nearby"),
+    path("search", views.search, name="search"),
+    path("pois", views.pois, name="pois"),
+    path("export", views.export, name="export"),
+    path("stats", views.stats, name="stats"),
+    path("async/nearby", views.nearby_async, name="nearby_async"),
+    path("async/search", views.search_async, name="search_async"),
+    path("async/pois", views.pois_async, name="pois_async"),
+]
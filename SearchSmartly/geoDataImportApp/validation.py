@@ -0,0 +1,165 @@
+from itertools import compress, repeat
+from operator import itemgetter
+
+import numpy as np
+
+from geoDataImportApp.ratings import RATING_FORMAT, RATING_SIZE
+from geoDataImportApp.readers import POI_CATEGORY, POI_ID, POI_LATITUDE, POI_LONGITUDE, POI_NAME, POI_RATINGS, RECORD_FIELDS, record_description
+
+ROW_COLUMNS = itemgetter(POI_ID, POI_NAME, POI_LATITUDE, POI_LONGITUDE, POI_CATEGORY, POI_RATINGS)
+RATINGS_ROW_MARKER = '\x1e'
+RATINGS_ROW_SEPARATOR = ',' + RATINGS_ROW_MARKER + ','
+MAX_LATITUDE = 90.0
+MAX_LONGITUDE = 180.0
+
+
+def validate_batch(rows, data_origin, rejected=None):
+    # Column-wise equivalent of import_poi_data_lightning.validate_and_create_point:
+    # ids, coordinates and ratings are parsed for the whole batch at once, bad rows
+    # are tracked in a mask and dropped when the output tuples are assembled.
+    # Indexes of dropped rows are appended to rejected, when given.
+    if not rows:
+        return []
+
+    try:
+        columns = list(map(ROW_COLUMNS, rows))
+    except IndexError:
+        # Short rows (a CSV line with missing fields) are padded so they fail validation
+        columns = [ROW_COLUMNS(row if len(row) > POI_RATINGS else list(row) + [None] * (POI_RATINGS + 1 - len(row))) for row in rows]
+    poi_ids, poi_names, poi_latitudes, poi_longitudes, poi_categories, poi_ratings = zip(*columns)
+    poi_ids, valid = parse_column(poi_ids, int)
+    poi_latitudes, latitude_valid = parse_column(poi_latitudes, float)
+    poi_longitudes, longitude_valid = parse_column(poi_longitudes, float)
+    rating_columns, ratings_valid = ratings_columns(poi_ratings)
+    poi_descriptions = list(map(record_description, rows))
+    valid &= np.fromiter(map(has_required_fields, poi_names, poi_categories, poi_descriptions), dtype=bool, count=len(rows))
+    # NaN fails every comparison, so the ranges also keep out non-finite values
+    latitude_valid &= np.abs(np.array(poi_latitudes, dtype=np.float64)) <= MAX_LATITUDE
+    longitude_valid &= np.abs(np.array(poi_longitudes, dtype=np.float64)) <= MAX_LONGITUDE
+    valid &= latitude_valid & longitude_valid & ratings_valid
+    if rejected is not None:
+        rejected.extend(np.flatnonzero(~valid).tolist())
+
+    return list(compress(zip(
+        poi_ids,
+        poi_names,
+        poi_latitudes,
+        poi_longitudes,
+        poi_categories,
+        poi_ratings,
+        poi_descriptions,
+        repeat(data_origin),
+        *rating_columns,
+    ), valid.tolist()))
+
+
+def rejection_reason(row):
+    # Why the lightning/fast validators drop a row, only worked out for rows
+    # that were dropped, for the import report
+    if len(row) <= POI_RATINGS:
+        return "invalid row"
+    for field, convert in ((POI_ID, int), (POI_LATITUDE, float), (POI_LONGITUDE, float)):
+        try:
+            convert(row[field])
+        except (TypeError, ValueError, OverflowError):
+            return f"invalid {RECORD_FIELDS[field]}"
+    for field, limit in ((POI_LATITUDE, MAX_LATITUDE), (POI_LONGITUDE, MAX_LONGITUDE)):
+        if not -limit <= float(row[field]) <= limit:
+            return f"invalid {RECORD_FIELDS[field]}"
+    if not has_required_fields(row[POI_NAME], row[POI_CATEGORY], record_description(row)):
+        return "missing required fields"
+    try:
+        [float(rating) for rating in row[POI_RATINGS].strip('{}').split(',') if rating.strip()]
+    except (AttributeError, ValueError):
+        return "invalid poi_ratings"
+    return "invalid row"
+
+
+def has_required_fields(name, category, description):
+    # The main table takes an empty description (CSV has none) but no NULL, and
+    # like import_poi_data no row without a name or category
+    return bool(name) and bool(category) and description is not None
+
+
+def valid_coordinates(latitude, longitude):
+    # False for coordinates off the globe, and for NaN, which fails every comparison
+    return -MAX_LATITUDE <= latitude <= MAX_LATITUDE and -MAX_LONGITUDE <= longitude <= MAX_LONGITUDE
+
+
+def parse_column(values, convert):
+    # Converts a whole column with map() so the loop runs in C. list.extend keeps
+    # everything converted before a failure, so a bad value only costs one
+    # restart instead of dropping the batch to a per-value Python loop.
+    valid = np.ones(len(values), dtype=bool)
+    parsed = []
+    remaining = iter(values)
+    while True:
+        try:
+            parsed.extend(map(convert, remaining))
+            break
+        except (TypeError, ValueError, OverflowError):
+            valid[len(parsed)] = False
+            parsed.append(0)
+    return parsed, valid
+
+
+def ratings_columns(poi_ratings):
+    # Tokenises every row's "{3.0,4.5}" string with a single join/split, with a
+    # marker token between rows, parses the tokens in one pass and aggregates
+    # them per row with NumPy. Returns the columns of ratings.rating_columns()
+    # (average, count, sum, min, max, packed values) and the valid mask.
+    row_count = len(poi_ratings)
+    valid = np.ones(row_count, dtype=bool)
+    try:
+        stripped = [ratings.strip('{}') for ratings in poi_ratings]
+    except AttributeError:
+        stripped = []
+        for index, ratings in enumerate(poi_ratings):
+            if isinstance(ratings, str):
+                stripped.append(ratings.strip('{}'))
+            else:
+                stripped.append('')
+                valid[index] = False
+
+    tokens = np.array(RATINGS_ROW_SEPARATOR.join(stripped).split(','), dtype=object)
+    row_ends = tokens == RATINGS_ROW_MARKER
+    token_rows = np.cumsum(row_ends)
+    if token_rows[-1] != row_count - 1:
+        # A rating that is literally the marker; count the commas of each row instead
+        tokens_per_row = np.fromiter(map(str.count, stripped, repeat(',')), dtype=np.int64, count=row_count) + 1
+        tokens = np.array(','.join(stripped).split(','), dtype=object)
+        row_ends = np.zeros(len(tokens), dtype=bool)
+        token_rows = np.repeat(np.arange(row_count), tokens_per_row)
+
+    present = (tokens != '') & ~row_ends
+    values, parsed = parse_column(tokens[present].tolist(), float)
+    values = np.array(values, dtype=np.float64)
+    if not parsed.all():
+        # Whitespace-only tokens are skipped like empty ones, anything else invalidates its row
+        blank = np.array([not token.strip() for token in tokens[present][~parsed]], dtype=bool)
+        valid[token_rows[present][~parsed][~blank]] = False
+        values = values[parsed]
+        present[np.flatnonzero(present)[~parsed]] = False
+
+    # bincount adds the weights in array order, so each row is summed left to
+    # right exactly like sum() in the row-at-a-time code.
+    value_rows = token_rows[present]
+    counts = np.bincount(value_rows, minlength=row_count)
+    sums = np.bincount(value_rows, weights=values, minlength=row_count)
+
+    averages = np.zeros(row_count)
+    np.divide(sums, counts, out=averages, where=counts > 0)
+
+    # A row's values are contiguous, so min and max are one reduceat each
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    rated = np.flatnonzero(counts)
+    minimums = [None] * row_count
+    maximums = [None] * row_count
+    if len(rated):
+        for index, low, high in zip(rated.tolist(), np.minimum.reduceat(values, starts[rated]).tolist(), np.maximum.reduceat(values, starts[rated]).tolist()):
+            minimums[index] = low
+            maximums[index] = high
+    packed = values.astype(RATING_FORMAT).tobytes()
+    packed_values = [packed[start * RATING_SIZE:end * RATING_SIZE] for start, end in zip(starts.tolist(), ends.tolist())]
+    return (averages.tolist(), counts.tolist(), sums.tolist(), minimums, maximums, packed_values), valid
@@ -1,6 +1,321 @@
+import json
+import math
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import connection
+from geoDataImportApp.export import CONTENT_TYPES, EXPORT_ENCODERS, gzip_chunks, iter_export_rows
+from geoDataImportApp.models import CategoryStats, PointsOfInterest
+from geoDataImportApp.querycache import cached_query
+from geoDataImportApp.readpool import read_connection, read_rows, read_values, run_read
+from geoDataImportApp.search import match_expression
+from geoDataImportApp.stats import RATING_STARS
+
+NEARBY_FIELDS = ('poi_id', 'poi_name', 'poi_category', 'poi_latitude', 'poi_longitude', 'average_rating')
+NEARBY_DEFAULT_K = 10
+NEARBY_MAX_K = 1000
+SEARCH_FIELDS = ('poi_id', 'poi_name', 'poi_category', 'poi_latitude', 'poi_longitude', 'average_rating', 'poi_description')
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 1000
+POI_FIELDS = (
+    'poi_id', 'poi_name', 'poi_category', 'poi_latitude', 'poi_longitude', 'poi_ratings', 'poi_description',
+    'data_origin', 'average_rating', 'rating_count', 'rating_min', 'rating_max',
+)
+POI_DEFAULT_LIMIT = 100
+POI_MAX_LIMIT = 50000
+# Rows fetched from SQLite and written to the response at a time
+POI_CHUNK_ROWS = 2000
 
 
 def index(request):
     return HttpResponse("Hello, world. You're at the geoDataImportApp index.")
+
+
+def nearby(request):
+    # /geo/nearby?lat=&lon=&radius=&k=&category=
+    # The k PoIs closest to lat/lon, nearest first, optionally within radius metres
+    try:
+        latitude, longitude, radius, k = nearby_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    results = find_nearby(category_queryset(request), latitude, longitude, radius, k)
+    return JsonResponse({'count': len(results), 'results': results})
+
+
+async def nearby_async(request):
+    # /geo/async/nearby, the same as nearby() on the read pool
+    try:
+        latitude, longitude, radius, k = nearby_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    results = await run_read(find_nearby, category_queryset(request), latitude, longitude, radius, k, read_rows)
+    return JsonResponse({'count': len(results), 'results': results})
+
+
+def nearby_params(request):
+    latitude = float_param(request, 'lat', -90, 90)
+    longitude = float_param(request, 'lon', -180, 180)
+    radius = float_param(request, 'radius', 0, None, required=False)
+    k = request.GET.get('k') or str(NEARBY_DEFAULT_K)
+    if not k.isdigit() or not 1 <= int(k) <= NEARBY_MAX_K:
+        raise ValueError(f"k must be between 1 and {NEARBY_MAX_K}")
+    return latitude, longitude, radius, int(k)
+
+
+def find_nearby(queryset, latitude, longitude, radius, k, fetch=list):
+    return [
+        dict(zip(NEARBY_FIELDS, values), distance=round(distance, 1))
+        for values, distance in queryset.nearest(latitude, longitude, k, radius, NEARBY_FIELDS, fetch)
+    ]
+
+
+def category_queryset(request):
+    queryset = PointsOfInterest.objects.all()
+    if request.GET.get('category'):
+        queryset = queryset.filter(poi_category=request.GET['category'])
+    return queryset
+
+
+def search(request):
+    # /geo/search?q=&limit=&category=
+    # PoIs whose name or description has every word of q (as a prefix), best match first
+    try:
+        query, limit = search_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    def find_matches():
+        return list(search_queryset(request, query, limit))
+
+    # Popular searches are answered from the cache until the next import
+    results = cached_query('search', search_key(request, query, limit), find_matches)
+    return JsonResponse({'count': len(results), 'results': results})
+
+
+async def search_async(request):
+    # /geo/async/search, the same as search() on the read pool, sharing its cache
+    try:
+        query, limit = search_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    def find_matches():
+        return read_values(search_queryset(request, query, limit))
+
+    def cached_matches():
+        return cached_query('search', search_key(request, query, limit), find_matches, cursor=read_connection().cursor())
+
+    results = await run_read(cached_matches)
+    return JsonResponse({'count': len(results), 'results': results})
+
+
+def search_params(request):
+    query = request.GET.get('q', '')
+    limit = request.GET.get('limit') or str(SEARCH_DEFAULT_LIMIT)
+    if not query.strip():
+        raise ValueError("'q' is required")
+    if not match_expression(query):
+        raise ValueError("'q' has no words to search for")
+    if not limit.isdigit() or not 1 <= int(limit) <= SEARCH_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {SEARCH_MAX_LIMIT}")
+    return query, int(limit)
+
+
+def search_queryset(request, query, limit):
+    queryset = PointsOfInterest.objects.search(query)
+    if request.GET.get('category'):
+        queryset = queryset.filter(poi_category=request.GET['category'])
+    return queryset.values(*SEARCH_FIELDS, 'search_rank')[:limit]
+
+
+def search_key(request, query, limit):
+    return match_expression(query), request.GET.get('category'), limit
+
+
+def pois(request):
+    # /geo/pois?category=&origin=&min_rating=&max_rating=&fields=&after=&limit=
+    # PoIs in poi_id order, one page at a time. The next page starts after the
+    # last id of this one (a seek on the primary key, whatever the depth) and
+    # its URL comes at the end of the response, which is streamed.
+    try:
+        queryset, fields, limit = pois_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # One row past the page tells whether there is a next one
+    rows = queryset.values_list(*fields)[:limit + 1].iterator(chunk_size=POI_CHUNK_ROWS)
+    return StreamingHttpResponse(stream_page(request, rows, fields, limit), content_type='application/json')
+
+
+async def pois_async(request):
+    # /geo/async/pois, the same pages as pois(). Every chunk is a query of its
+    # own, continuing after the last id of the one before, so no pool
+    # connection is held while the response is sent.
+    try:
+        queryset, fields, limit = pois_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return StreamingHttpResponse(stream_page_async(request, queryset, fields, limit), content_type='application/json')
+
+
+def pois_params(request):
+    min_rating = float_param(request, 'min_rating', -math.inf, None, required=False)
+    max_rating = float_param(request, 'max_rating', -math.inf, None, required=False)
+    after = int_param(request, 'after', None, None)
+    limit = int_param(request, 'limit', 1, POI_MAX_LIMIT, POI_DEFAULT_LIMIT)
+    # poi_id is always returned, it is what the next page starts after
+    requested = [field for field in request.GET.get('fields', '').split(',') if field]
+    fields = ['poi_id'] + [field for field in requested if field != 'poi_id'] if requested else list(POI_FIELDS)
+    unknown = [field for field in fields if field not in POI_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    queryset = PointsOfInterest.objects.order_by('poi_id')
+    if request.GET.get('category'):
+        queryset = queryset.filter(poi_category=request.GET['category'])
+    if request.GET.get('origin'):
+        queryset = queryset.filter(data_origin=request.GET['origin'])
+    if min_rating is not None:
+        queryset = queryset.filter(average_rating__gte=min_rating)
+    if max_rating is not None:
+        queryset = queryset.filter(average_rating__lte=max_rating)
+    if after is not None:
+        queryset = queryset.filter(poi_id__gt=after)
+    return queryset, fields, limit
+
+
+def stream_page(request, rows, fields, limit):
+    yield '{"results": ['
+    written = 0
+    last_id = None
+    chunk = []
+    for row in rows:
+        if written + len(chunk) == limit:
+            last_id = chunk[-1]['poi_id'] if chunk else last_id
+            break
+        chunk.append(dict(zip(fields, row)))
+        if len(chunk) == POI_CHUNK_ROWS:
+            # One dumps() per chunk, without the list brackets
+            yield (', ' if written else '') + json.dumps(chunk)[1:-1]
+            written += len(chunk)
+            last_id = row[0]
+            chunk = []
+    else:
+        last_id = None
+    if chunk:
+        yield (', ' if written else '') + json.dumps(chunk)[1:-1]
+        written += len(chunk)
+
+    yield f'], "count": {written}, "next": {json.dumps(next_page_url(request, last_id))}}}'
+
+
+async def stream_page_async(request, queryset, fields, limit):
+    yield '{"results": ['
+    written = 0
+    last_id = None
+    more = True
+    while more and written < limit:
+        size = min(POI_CHUNK_ROWS, limit - written)
+        chunk = queryset if last_id is None else queryset.filter(poi_id__gt=last_id)
+        more, chunk_last_id, count, text = await run_read(encode_chunk, chunk.values_list(*fields)[:size + 1], fields, size)
+        if count:
+            yield (', ' if written else '') + text
+            written += count
+            last_id = chunk_last_id
+    yield f'], "count": {written}, "next": {json.dumps(next_page_url(request, last_id if more else None))}}}'
+
+
+def encode_chunk(queryset, fields, size):
+    # Reads and encodes a chunk on the pool thread. The queryset asks for one
+    # row more than size, which tells whether anything follows.
+    rows = read_rows(queryset)
+    more = len(rows) > size
+    rows = rows[:size]
+    text = json.dumps([dict(zip(fields, row)) for row in rows])[1:-1]
+    return more, rows[-1][0] if rows else None, len(rows), text
+
+
+def next_page_url(request, last_id):
+    if last_id is None:
+        return None
+    query = request.GET.copy()
+    query['after'] = last_id
+    return f"{request.path}?{query.urlencode()}"
+
+
+def export(request):
+    # /geo/export?format=csv|json|ndjson|xml&gzip=1
+    # The whole table as a download the importers can read back, encoded and
+    # optionally compressed chunk by chunk as it is sent
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in EXPORT_ENCODERS:
+        return JsonResponse({'error': f"format must be one of {', '.join(EXPORT_ENCODERS)}"}, status=400)
+    compress = request.GET.get('gzip') in ('1', 'true')
+
+    def chunks():
+        with connection.cursor() as cursor:
+            encoded = EXPORT_ENCODERS[file_format](iter_export_rows(cursor))
+            if compress:
+                yield from gzip_chunks(encoded)
+            else:
+                yield from (text.encode('utf-8') for text in encoded)
+
+    filename = f"pois.{file_format}" + ('.gz' if compress else '')
+    response = StreamingHttpResponse(chunks(), content_type='application/gzip' if compress else CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def stats(request):
+    # /geo/stats?category=
+    # Counts, ratings and bounding box of every category, read from the stats
+    # table the importers keep, so it costs the same whatever the table size
+    queryset = CategoryStats.objects.order_by('poi_category')
+    if request.GET.get('category'):
+        queryset = queryset.filter(poi_category=request.GET['category'])
+
+    results = [
+        {
+            'poi_category': category.poi_category,
+            'poi_count': category.poi_count,
+            'rating_count': category.rating_count,
+            'average_rating': category.average_rating,
+            'rating_distribution': {
+                'unrated': category.poi_count - category.rated_count,
+                **{str(stars): getattr(category, f'rated_{stars}') for stars in RATING_STARS},
+            },
+            'bbox': {
+                'south': category.min_latitude, 'west': category.min_longitude,
+                'north': category.max_latitude, 'east': category.max_longitude,
+            },
+        }
+        for category in queryset
+    ]
+    return JsonResponse({'count': len(results), 'results': results})
+
+
+def int_param(request, name, lowest, highest, default=None):
+    value = request.GET.get(name, '')
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer, got '{value}'")
+    if (lowest is not None and number < lowest) or (highest is not None and number > highest):
+        raise ValueError(f"'{name}' is out of range: {value}")
+    return number
+
+
+def float_param(request, name, lowest, highest, required=True):
+    value = request.GET.get(name, '')
+    if not value:
+        if required:
+            raise ValueError(f"'{name}' is required")
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be a number, got '{value}'")
+    if not math.isfinite(number) or number < lowest or (highest is not None and number > highest):
+        raise ValueError(f"'{name}' is out of range: {value}")
+    return number
@@ -0,0 +1,138 @@
+import time
+import argparse
+import sqlite3
+from queue import Empty
+from django.conf import settings
+from geoDataImportApp.manifest import ImportCheckpoint, save_checkpoint
+from geoDataImportApp.querycache import bump_generation
+from geoDataImportApp.search import index_staged_text_sql
+from geoDataImportApp.spatial import index_copied_points_sql, unindex_staged_points_sql
+from geoDataImportApp.stats import settle_category_stats, staged_stats_sql
+from geoDataImportApp.upsert import CREATE_TEMP_TABLE_SQL, POI_TEMP_TABLE, copy_from_temp_sql, insert_sql, with_content_hash
+
+COMMIT_ROWS = 100000
+COMMIT_INTERVAL = 1.0
+
+
+def parse_interval(value):
+    # argparse type for --commit-interval, in seconds
+    try:
+        interval = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid interval: '{value}'")
+    if interval <= 0:
+        raise argparse.ArgumentTypeError(f"Interval must be positive: '{value}'")
+    return interval
+
+
+def save_to_database(db_queue, reader_count, telemetry, upsert=False, commit_rows=COMMIT_ROWS, commit_interval=COMMIT_INTERVAL, failed=None):
+    # The single writer of an import: every reader feeds the same queue and sends
+    # None when it is done. Rows are staged in a TEMP table with one prepared
+    # insert and moved into the main table in groups, once commit_rows rows are
+    # staged or commit_interval seconds have passed, together with the latest
+    # checkpoint of every file the group covers. A group that can't be staged or
+    # committed is rolled back and nothing more is written; the files with rows
+    # in it or after it go into failed as (file path, error) without their
+    # checkpoints, so the next run resumes them from the last committed one.
+    conn = sqlite3.connect(settings.DATABASES['default']['NAME'])
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL;")
+    cursor.execute("PRAGMA synchronous = OFF;")
+    cursor.execute("PRAGMA cache_size = 1000000;")
+    cursor.execute("PRAGMA temp_store = MEMORY;")
+    cursor.execute(CREATE_TEMP_TABLE_SQL)
+
+    conn.commit()
+    insert = insert_sql(POI_TEMP_TABLE, upsert)
+    failed = [] if failed is None else failed
+    checkpoints = {}
+    staged_rows = 0
+    error = None
+    last_commit = time.perf_counter()
+    with telemetry.profile('save_to_database'):
+        while reader_count:
+            try:
+                batch = db_queue.get(timeout=commit_interval)
+            except Empty:
+                batch = False
+            else:
+                if batch is None:
+                    reader_count -= 1
+                elif isinstance(batch, ImportCheckpoint):
+                    # A reader queues a file's checkpoint after its rows, so they are staged by now
+                    checkpoints[batch.file_path] = batch
+                elif batch and not error:
+                    try:
+                        # In upsert mode rows carry the hash the main table is compared on
+                        with telemetry.stage('write'):
+                            cursor.executemany(insert, with_content_hash(batch) if upsert else batch)
+                        staged_rows += len(batch)
+                    except Exception as e:
+                        error = f"Error inserting data: {e}"
+                        conn.rollback()
+                db_queue.task_done()
+
+            if error:
+                # The readers are still drained, so none of them blocks on a full queue
+                mark_failed(failed, checkpoints, error)
+            elif staged_rows >= commit_rows or ((staged_rows or checkpoints) and time.perf_counter() - last_commit >= commit_interval):
+                error = commit_group(conn, cursor, telemetry, upsert, checkpoints)
+                staged_rows = 0
+                last_commit = time.perf_counter()
+
+        if not error:
+            error = commit_group(conn, cursor, telemetry, upsert, checkpoints)
+        if error:
+            mark_failed(failed, checkpoints, error)
+            if not any(failed_error == error for _, failed_error in failed):
+                # No checkpoints (import_poi_data_fast keeps no manifest), the run as a whole failed
+                failed.append((None, error))
+
+    cursor.close()
+    conn.close()
+
+
+def mark_failed(failed, checkpoints, error):
+    for file_path in checkpoints:
+        if file_path not in (failed_path for failed_path, _ in failed):
+            failed.append((file_path, error))
+    checkpoints.clear()
+
+
+def describe_failures(failed):
+    # The importers' error for a run with files that failed to be read or written
+    return f"{len(failed)} failure(s):\n" + "\n".join(
+        f"'{file_path}': {error}" if file_path else error for file_path, error in failed
+    )
+
+
+def commit_group(conn, cursor, telemetry, upsert, checkpoints):
+    # Returns None once the group is committed and its checkpoints cleared, or
+    # the error it was rolled back on
+    start_time = time.perf_counter()
+    try:
+        with telemetry.stage('copy'):
+            # Rows the main table would refuse (a missing field, or a NaN coordinate,
+            # which SQLite stores as NULL) go before anything indexes them
+            cursor.execute(
+                f"DELETE FROM {POI_TEMP_TABLE} WHERE poi_name IS NULL OR poi_category IS NULL OR poi_description IS NULL "
+                f"OR poi_latitude IS NULL OR poi_longitude IS NULL"
+            )
+            with telemetry.stage('index'):
+                for sql in unindex_staged_points_sql(upsert) + index_staged_text_sql(upsert) + staged_stats_sql(upsert):
+                    cursor.execute(sql)
+            cursor.execute(copy_from_temp_sql(upsert))
+            telemetry.count('rows_written', cursor.rowcount)
+            with telemetry.stage('index'):
+                cursor.execute(index_copied_points_sql())
+                settle_category_stats(cursor)
+            cursor.execute("DELETE FROM geoDataImportApp_pointsofinterest_temp")
+            for checkpoint in checkpoints.values():
+                save_checkpoint(cursor, checkpoint)
+            bump_generation(cursor)
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return f"Error committing data: {e}"
+    checkpoints.clear()
+    telemetry.commit(time.perf_counter() - start_time)